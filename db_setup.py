@@ -16,19 +16,129 @@ Key Features:
 import sqlite3
 import json
 import random
-from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import islice
+from datetime import datetime, timedelta, timezone
 
-def create_services_database():
+SERVICES_DB_PATH = 'healthcare_services.db'
+APPOINTMENTS_DB_PATH = 'appointments.db'
+
+# Connection tuning for the bulk load: WAL + NORMAL sync avoids an fsync per
+# statement, and the exclusive lock skips shared-lock churn while we own the file.
+# Per-schema settings are applied to both the main and the attached database.
+SQLITE_SCHEMA_PRAGMAS = ('journal_mode=WAL', 'synchronous=NORMAL', 'cache_size=-16000', 'locking_mode=EXCLUSIVE')
+SQLITE_CONNECTION_PRAGMAS = ('temp_store=MEMORY', 'foreign_keys=ON')
+
+# Conservative bound-parameter limit per statement (SQLITE_MAX_VARIABLE_NUMBER on older builds)
+SQLITE_MAX_VARIABLES = 999
+
+# Column lists for the bulk-loaded tables
+CLINIC_COLUMNS = ('name', 'address', 'city', 'state', 'pincode', 'phone', 'email', 'operating_hours', 'created_at')
+SERVICE_COLUMNS = ('name', 'description', 'duration_minutes', 'price', 'department', 'clinic_id', 'created_at')
+DOCTOR_COLUMNS = ('name', 'specialty', 'phone', 'email', 'clinic_id', 'available_days', 'available_days_mask',
+                  'working_hours_start', 'working_hours_end', 'working_hours_display', 'created_at')
+DOCTOR_SERVICE_COLUMNS = ('doctor_id', 'service_id')
+DOCTOR_AVAILABILITY_COLUMNS = ('doctor_id', 'day_of_week')
+
+# 30-minute time slots for every doctor working day, generated inside SQLite
+GENERATE_TIME_SLOTS_SQL = '''
+    INSERT INTO time_slots (doctor_id, day_of_week, start_time, end_time, is_available, slot_type, created_at)
+    WITH RECURSIVE slots(doctor_id, day_of_week, slot_min, day_end) AS (
+        SELECT d.id, da.day_of_week,
+               CAST(substr(d.working_hours_start, 1, 2) AS INTEGER) * 60 + CAST(substr(d.working_hours_start, 4, 2) AS INTEGER),
+               CAST(substr(d.working_hours_end, 1, 2) AS INTEGER) * 60 + CAST(substr(d.working_hours_end, 4, 2) AS INTEGER)
+        FROM doctors d
+        JOIN doctor_availability da ON da.doctor_id = d.id
+        UNION ALL
+        SELECT doctor_id, day_of_week, slot_min + 30, day_end
+        FROM slots
+        WHERE slot_min + 60 <= day_end
+    )
+    SELECT doctor_id, day_of_week,
+           printf('%02d:%02d:00', slot_min / 60, slot_min % 60),
+           printf('%02d:%02d:00', (slot_min + 30) / 60, (slot_min + 30) % 60),
+           1, 'regular', ?
+    FROM slots
+    WHERE slot_min + 30 <= day_end
+    ORDER BY doctor_id, day_of_week, slot_min
+'''
+
+# Trigram full-text index over the searchable service columns, shared by both servers' service
+# search and kept in sync by triggers; the trigram tokenizer matches any substring of 3+ characters,
+# like the LIKE '%q%' search it speeds up. Needs FTS5 with the trigram tokenizer (SQLite 3.34+)
+SERVICES_SEARCH_SQL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS services_search USING fts5(
+        name, description, department, content='services', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS services_search_insert AFTER INSERT ON services BEGIN
+        INSERT INTO services_search (rowid, name, description, department)
+        VALUES (new.id, new.name, new.description, new.department);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS services_search_delete AFTER DELETE ON services BEGIN
+        INSERT INTO services_search (services_search, rowid, name, description, department)
+        VALUES ('delete', old.id, old.name, old.description, old.department);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS services_search_update AFTER UPDATE ON services BEGIN
+        INSERT INTO services_search (services_search, rowid, name, description, department)
+        VALUES ('delete', old.id, old.name, old.description, old.department);
+        INSERT INTO services_search (rowid, name, description, department)
+        VALUES (new.id, new.name, new.description, new.department);
+    END""",
+    "INSERT INTO services_search (services_search) VALUES ('rebuild')",
+)
+
+# Day names to numbers (Monday=1, Sunday=7)
+DAY_MAPPING = {
+    "Monday": 1, "Tuesday": 2, "Wednesday": 3, "Thursday": 4,
+    "Friday": 5, "Saturday": 6, "Sunday": 7
+}
+
+DAY_NAMES = {day_num: day_name for day_name, day_num in DAY_MAPPING.items()}
+
+def days_in_mask(mask):
+    """Day numbers (Monday=1, Sunday=7) whose bit is set in an availability bitmask"""
+    return [day_num for day_num in range(1, 8) if mask & (1 << day_num)]
+
+@lru_cache(maxsize=None)
+def multi_insert_sql(table, columns, row_count):
+    """Build (once) the SQL text for a multi-row insert so repeated shapes hit the statement cache"""
+    group = "(" + ", ".join("?" * len(columns)) + ")"
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([group] * row_count)}"
+
+def multi_insert(conn, table, columns, rows):
+    """Insert rows with multi-row VALUES statements, chunked under SQLite's bound-parameter cap.
+    
+    rows may be any iterable (e.g. a generator); it is consumed one chunk at a time.
+    """
+    chunk_size = max(1, SQLITE_MAX_VARIABLES // len(columns))
+    rows = iter(rows)
+    inserted = 0
+    
+    while chunk := list(islice(rows, chunk_size)):
+        sql = multi_insert_sql(table, columns, len(chunk))
+        conn.execute(sql, [value for row in chunk for value in row])
+        inserted += len(chunk)
+    
+    return inserted
+
+def open_setup_connection():
+    """Open one connection to the services database with appointments.db attached as 'app'"""
+    conn = sqlite3.connect(SERVICES_DB_PATH, isolation_level=None, cached_statements=256)
+    conn.execute("ATTACH DATABASE ? AS app", (APPOINTMENTS_DB_PATH,))
+    
+    pragmas = [f"PRAGMA {schema}.{pragma};" for schema in ('main', 'app') for pragma in SQLITE_SCHEMA_PRAGMAS]
+    pragmas += [f"PRAGMA {pragma};" for pragma in SQLITE_CONNECTION_PRAGMAS]
+    conn.executescript("\n".join(pragmas))
+    return conn
+
+def create_services_database(conn):
     """Create and populate the healthcare services database"""
     print("Creating healthcare_services.db...")
     
-    conn = sqlite3.connect('healthcare_services.db')
-    cursor = conn.cursor()
-    
     # Create clinics table
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS clinics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER PRIMARY KEY,
             name TEXT NOT NULL,
             address TEXT,
             city TEXT DEFAULT 'Karimnagar',
@@ -42,9 +152,9 @@ def create_services_database():
     ''')
     
     # Create services table
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS services (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER PRIMARY KEY,
             name TEXT NOT NULL,
             description TEXT,
             duration_minutes INTEGER DEFAULT 30,
@@ -57,15 +167,16 @@ def create_services_database():
     ''')
     
     # Create doctors table with proper time ranges
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS doctors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER PRIMARY KEY,
             name TEXT NOT NULL,
             specialty TEXT,
             phone TEXT,
             email TEXT,
             clinic_id INTEGER,
-            available_days TEXT, -- JSON array of available days
+            available_days TEXT, -- JSON array of available days (display)
+            available_days_mask INTEGER, -- bit N set = works on day N (Monday=1)
             working_hours_start TIME, -- e.g., "10:00:00"
             working_hours_end TIME,   -- e.g., "18:00:00"
             working_hours_display TEXT, -- e.g., "10:00 AM - 6:00 PM"
@@ -75,21 +186,30 @@ def create_services_database():
     ''')
     
     # Create doctor_services junction table (many-to-many relationship)
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS doctor_services (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER PRIMARY KEY,
             doctor_id INTEGER,
             service_id INTEGER,
             FOREIGN KEY (doctor_id) REFERENCES doctors (id),
-            FOREIGN KEY (service_id) REFERENCES services (id),
-            UNIQUE(doctor_id, service_id)
+            FOREIGN KEY (service_id) REFERENCES services (id)
+        )
+    ''')
+    
+    # Create doctor availability table (one row per doctor working day)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS doctor_availability (
+            doctor_id INTEGER,
+            day_of_week INTEGER, -- 1=Monday, 7=Sunday
+            PRIMARY KEY (doctor_id, day_of_week),
+            FOREIGN KEY (doctor_id) REFERENCES doctors (id)
         )
     ''')
     
     # Create time slots table
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS time_slots (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER PRIMARY KEY,
             doctor_id INTEGER,
             day_of_week INTEGER, -- 1=Monday, 7=Sunday
             start_time TIME NOT NULL,
@@ -101,6 +221,18 @@ def create_services_database():
         )
     ''')
     
+    # Re-running the script against a populated database would only duplicate rows
+    if conn.execute("SELECT EXISTS(SELECT 1 FROM clinics)").fetchone()[0]:
+        print("✅ healthcare_services.db is already populated, skipping data load")
+        return
+    
+    # Schema is in place; load all reference data in one transaction
+    # (one commit instead of one per statement) with no DDL inside it
+    conn.execute('BEGIN IMMEDIATE')
+    
+    # One load timestamp for every row, in CURRENT_TIMESTAMP's UTC format
+    created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    
     # Insert clinics
     clinics = [
         ("HealthCare Plus Clinic", "Main Road, Beside SBI Bank", "Karimnagar", "Telangana", "505001", "+91-8765-432109", "info@healthcareplus.in", "9:00 AM - 8:00 PM"),
@@ -109,10 +241,7 @@ def create_services_database():
         ("Family Care Clinic", "Rekurthi Road, Near Railway Station", "Karimnagar", "Telangana", "505003", "+91-8912-345678", "familycare@clinic.in", "10:00 AM - 7:00 PM")
     ]
     
-    cursor.executemany('''
-        INSERT INTO clinics (name, address, city, state, pincode, phone, email, operating_hours)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', clinics)
+    clinic_count = multi_insert(conn, 'clinics', CLINIC_COLUMNS, ((*clinic, created_at) for clinic in clinics))
     
     # Insert healthcare services
     services = [
@@ -133,29 +262,27 @@ def create_services_database():
         ("Diabetes Consultation", "Blood sugar management and counseling", 30, 180.00, "Endocrinology", 3)
     ]
     
-    cursor.executemany('''
-        INSERT INTO services (name, description, duration_minutes, price, department, clinic_id)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', services)
+    service_count = multi_insert(conn, 'services', SERVICE_COLUMNS, ((*service, created_at) for service in services))
     
-    # Insert doctors with proper working hours
+    # Insert doctors with proper working hours; available days are a bitmask
+    # where bit N is set when the doctor works on day N (Monday=1, Sunday=7)
     doctors = [
-        ("Dr. Rajesh Kumar", "General Medicine", "+91-9876-543201", "rajesh.kumar@clinic.in", 1, '["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]', "09:00:00", "17:00:00", "9:00 AM - 5:00 PM"),
-        ("Dr. Priya Sharma", "Cardiology", "+91-8765-432102", "priya.sharma@clinic.in", 3, '["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]', "10:00:00", "18:00:00", "10:00 AM - 6:00 PM"),
-        ("Dr. Suresh Reddy", "Dermatology", "+91-7654-321903", "suresh.reddy@clinic.in", 2, '["Tuesday", "Thursday", "Friday", "Saturday"]', "11:00:00", "19:00:00", "11:00 AM - 7:00 PM"),
-        ("Dr. Meera Patel", "Ophthalmology", "+91-9123-456704", "meera.patel@clinic.in", 1, '["Monday", "Wednesday", "Thursday", "Friday", "Saturday"]', "08:30:00", "16:30:00", "8:30 AM - 4:30 PM"),
-        ("Dr. Vikram Singh", "Mental Health", "+91-8234-567105", "vikram.singh@clinic.in", 4, '["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]', "10:00:00", "18:00:00", "10:00 AM - 6:00 PM"),
-        ("Dr. Anita Gupta", "Pediatrics", "+91-7345-678906", "anita.gupta@clinic.in", 1, '["Monday", "Tuesday", "Wednesday", "Friday", "Saturday"]', "09:00:00", "17:00:00", "9:00 AM - 5:00 PM"),
-        ("Dr. Ravi Krishnan", "Gynecology", "+91-9456-789107", "ravi.krishnan@clinic.in", 3, '["Monday", "Wednesday", "Thursday", "Friday"]', "14:00:00", "20:00:00", "2:00 PM - 8:00 PM"),
-        ("Dr. Sunita Rao", "Orthopedics", "+91-8567-891208", "sunita.rao@clinic.in", 2, '["Tuesday", "Wednesday", "Thursday", "Saturday"]', "09:30:00", "17:30:00", "9:30 AM - 5:30 PM"),
-        ("Dr. Arun Kumar", "ENT", "+91-7678-912309", "arun.kumar@clinic.in", 4, '["Monday", "Tuesday", "Friday", "Saturday"]', "10:30:00", "18:30:00", "10:30 AM - 6:30 PM"),
-        ("Dr. Kavitha Nair", "Endocrinology", "+91-9789-123410", "kavitha.nair@clinic.in", 3, '["Monday", "Wednesday", "Thursday", "Friday"]', "11:00:00", "19:00:00", "11:00 AM - 7:00 PM")
+        ("Dr. Rajesh Kumar", "General Medicine", "+91-9876-543201", "rajesh.kumar@clinic.in", 1, 0b01111110, "09:00:00", "17:00:00", "9:00 AM - 5:00 PM"),
+        ("Dr. Priya Sharma", "Cardiology", "+91-8765-432102", "priya.sharma@clinic.in", 3, 0b00111110, "10:00:00", "18:00:00", "10:00 AM - 6:00 PM"),
+        ("Dr. Suresh Reddy", "Dermatology", "+91-7654-321903", "suresh.reddy@clinic.in", 2, 0b01110100, "11:00:00", "19:00:00", "11:00 AM - 7:00 PM"),
+        ("Dr. Meera Patel", "Ophthalmology", "+91-9123-456704", "meera.patel@clinic.in", 1, 0b01111010, "08:30:00", "16:30:00", "8:30 AM - 4:30 PM"),
+        ("Dr. Vikram Singh", "Mental Health", "+91-8234-567105", "vikram.singh@clinic.in", 4, 0b00111110, "10:00:00", "18:00:00", "10:00 AM - 6:00 PM"),
+        ("Dr. Anita Gupta", "Pediatrics", "+91-7345-678906", "anita.gupta@clinic.in", 1, 0b01101110, "09:00:00", "17:00:00", "9:00 AM - 5:00 PM"),
+        ("Dr. Ravi Krishnan", "Gynecology", "+91-9456-789107", "ravi.krishnan@clinic.in", 3, 0b00111010, "14:00:00", "20:00:00", "2:00 PM - 8:00 PM"),
+        ("Dr. Sunita Rao", "Orthopedics", "+91-8567-891208", "sunita.rao@clinic.in", 2, 0b01011100, "09:30:00", "17:30:00", "9:30 AM - 5:30 PM"),
+        ("Dr. Arun Kumar", "ENT", "+91-7678-912309", "arun.kumar@clinic.in", 4, 0b01100110, "10:30:00", "18:30:00", "10:30 AM - 6:30 PM"),
+        ("Dr. Kavitha Nair", "Endocrinology", "+91-9789-123410", "kavitha.nair@clinic.in", 3, 0b00111010, "11:00:00", "19:00:00", "11:00 AM - 7:00 PM")
     ]
     
-    cursor.executemany('''
-        INSERT INTO doctors (name, specialty, phone, email, clinic_id, available_days, working_hours_start, working_hours_end, working_hours_display)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', doctors)
+    doctor_count = multi_insert(conn, 'doctors', DOCTOR_COLUMNS, (
+        (*doctor[:5], json.dumps([DAY_NAMES[day] for day in days_in_mask(doctor[5])]), *doctor[5:], created_at)
+        for doctor in doctors
+    ))
     
     # Create doctor-service relationships
     doctor_service_mappings = [
@@ -185,88 +312,58 @@ def create_services_database():
         (4, 1),  # Eye doctor can do general checkups
     ]
     
-    cursor.executemany('''
-        INSERT OR IGNORE INTO doctor_services (doctor_id, service_id)
-        VALUES (?, ?)
-    ''', doctor_service_mappings)
+    # Uniqueness is enforced by an index built after the load, so drop duplicates
+    # up front (order-preserving) and insert with a plain INSERT
+    doctor_service_mappings = list(dict.fromkeys(doctor_service_mappings))
+    multi_insert(conn, 'doctor_services', DOCTOR_SERVICE_COLUMNS, doctor_service_mappings)
     
-    # Generate time slots for each doctor based on their working hours
-    time_slots = []
+    # Normalize each doctor's working days into doctor_availability
+    doctor_availability = (
+        (doctor_id, day_num)
+        for doctor_id, doctor in enumerate(doctors, start=1)
+        for day_num in days_in_mask(doctor[5])
+    )
+    multi_insert(conn, 'doctor_availability', DOCTOR_AVAILABILITY_COLUMNS, doctor_availability)
     
-    for doctor_id in range(1, 11):  # We have 10 doctors
-        # Get doctor's working hours
-        cursor.execute('SELECT working_hours_start, working_hours_end, available_days FROM doctors WHERE id = ?', (doctor_id,))
-        doctor_info = cursor.fetchone()
-        start_time_str, end_time_str, available_days_json = doctor_info
-        available_days = json.loads(available_days_json)
-        
-        # Convert day names to numbers (Monday=1, Sunday=7)
-        day_mapping = {
-            "Monday": 1, "Tuesday": 2, "Wednesday": 3, "Thursday": 4,
-            "Friday": 5, "Saturday": 6, "Sunday": 7
-        }
-        
-        for day_name in available_days:
-            day_num = day_mapping[day_name]
-            
-            # Parse working hours
-            start_hour, start_min = map(int, start_time_str.split(':')[:2])
-            end_hour, end_min = map(int, end_time_str.split(':')[:2])
-            
-            # Create 30-minute slots
-            current_hour, current_min = start_hour, start_min
-            
-            while (current_hour < end_hour) or (current_hour == end_hour and current_min < end_min):
-                slot_start = f"{current_hour:02d}:{current_min:02d}:00"
-                
-                # Calculate end time (30 minutes later)
-                end_slot_min = current_min + 30
-                end_slot_hour = current_hour
-                if end_slot_min >= 60:
-                    end_slot_min -= 60
-                    end_slot_hour += 1
-                
-                slot_end = f"{end_slot_hour:02d}:{end_slot_min:02d}:00"
-                
-                # Don't create slot if it goes beyond working hours
-                if end_slot_hour > end_hour or (end_slot_hour == end_hour and end_slot_min > end_min):
-                    break
-                
-                time_slots.append((
-                    doctor_id,
-                    day_num,
-                    slot_start,
-                    slot_end,
-                    1,  # is_available
-                    'regular'
-                ))
-                
-                # Move to next slot
-                current_min += 30
-                if current_min >= 60:
-                    current_min = 0
-                    current_hour += 1
-    
-    cursor.executemany('''
-        INSERT INTO time_slots (doctor_id, day_of_week, start_time, end_time, is_available, slot_type)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', time_slots)
-    
-    conn.commit()
-    conn.close()
-    print(f"✅ Created healthcare_services.db with {len(clinics)} clinics, {len(services)} services, {len(doctors)} doctors, and {len(time_slots)} time slots")
+    # Generate 30-minute time slots for each doctor inside SQLite from the
+    # doctor and availability rows just inserted
+    slot_count = conn.execute(GENERATE_TIME_SLOTS_SQL, (created_at,)).rowcount
+    
+    conn.execute('COMMIT')
+    
+    # Build indexes once the load is committed, outside the data transaction,
+    # instead of maintaining them per inserted row. These are the only services
+    # indexes: both servers rely on them instead of creating their own at startup
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_ds ON doctor_services (doctor_id, service_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ds_service ON doctor_services (service_id, doctor_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ts_doctor_day ON time_slots (doctor_id, day_of_week, start_time)')
+    # Open slots for a day across all doctors
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ts_available ON time_slots (day_of_week, doctor_id, start_time) WHERE is_available = 1')
+    # ORDER BY of the clinic, doctor and service listings and AI context
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_clinics_name ON clinics (name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_doctors_name ON doctors (name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_doctors_specialty ON doctors (specialty, name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_services_department ON services (department, name)')
+    
+    # Without FTS5 or its trigram tokenizer the servers keep searching services with LIKE
+    try:
+        for statement in SERVICES_SEARCH_SQL:
+            conn.execute(statement)
+    except sqlite3.OperationalError as e:
+        print(f"⚠️  Service search index not created ({e}); service search will use LIKE")
+    
+    print(f"✅ Created healthcare_services.db with {clinic_count} clinics, {service_count} services, {doctor_count} doctors, and {slot_count} time slots")
 
-def create_appointments_database():
-    """Create the appointments and patient data database"""
+def create_appointments_database(conn):
+    """Create the appointments and patient data database in the attached 'app' schema"""
     print("Creating appointments.db...")
     
-    conn = sqlite3.connect('appointments.db')
-    cursor = conn.cursor()
+    conn.execute('BEGIN IMMEDIATE')
     
     # Create patients table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS patients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS app.patients (
+            id INTEGER PRIMARY KEY,
             name TEXT,
             phone TEXT,
             email TEXT,
@@ -280,9 +377,9 @@ def create_appointments_database():
     ''')
     
     # Create appointments table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS appointments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS app.appointments (
+            id INTEGER PRIMARY KEY,
             patient_id INTEGER,
             doctor_id INTEGER,
             service_id INTEGER,
@@ -301,9 +398,9 @@ def create_appointments_database():
     ''')
     
     # Create chat summaries table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_summaries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS app.chat_summaries (
+            id INTEGER PRIMARY KEY,
             appointment_id INTEGER,
             patient_id INTEGER,
             conversation_text TEXT,
@@ -320,9 +417,9 @@ def create_appointments_database():
     ''')
     
     # Create interaction logs table for tracking all user interactions
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS interaction_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS app.interaction_logs (
+            id INTEGER PRIMARY KEY,
             session_id TEXT,
             patient_phone TEXT,
             user_input TEXT,
@@ -335,9 +432,9 @@ def create_appointments_database():
     ''')
     
     # Create appointment history table for tracking changes
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS appointment_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS app.appointment_history (
+            id INTEGER PRIMARY KEY,
             appointment_id INTEGER,
             old_status TEXT,
             new_status TEXT,
@@ -348,8 +445,13 @@ def create_appointments_database():
         )
     ''')
     
-    conn.commit()
-    conn.close()
+    # Indexes for the lookups the chat service performs
+    conn.execute('CREATE INDEX IF NOT EXISTS app.idx_app_doctor_date ON appointments (doctor_id, appointment_date, appointment_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS app.idx_app_patient ON appointments (patient_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS app.idx_chat_appt ON chat_summaries (appointment_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS app.idx_logs_session ON interaction_logs (session_id, timestamp)')
+    
+    conn.execute('COMMIT')
     print("✅ Created appointments.db with patient, appointment, and comprehensive tracking tables")
 
 def verify_databases():
@@ -358,23 +460,18 @@ def verify_databases():
     
     # Check services database
     try:
-        conn = sqlite3.connect('healthcare_services.db')
+        conn = sqlite3.connect(SERVICES_DB_PATH)
         cursor = conn.cursor()
         
-        cursor.execute("SELECT COUNT(*) FROM clinics")
-        clinics_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM services")
-        services_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM time_slots")
-        slots_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM doctors")
-        doctors_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM doctor_services")
-        doctor_services_count = cursor.fetchone()[0]
+        # Fetch all table counts in a single statement
+        cursor.execute("""
+            SELECT (SELECT COUNT(*) FROM clinics),
+                   (SELECT COUNT(*) FROM services),
+                   (SELECT COUNT(*) FROM doctors),
+                   (SELECT COUNT(*) FROM doctor_services),
+                   (SELECT COUNT(*) FROM time_slots)
+        """)
+        clinics_count, services_count, doctors_count, doctor_services_count, slots_count = cursor.fetchone()
         
         print(f"📋 Services Database:")
         print(f"   • {clinics_count} clinics")
@@ -401,7 +498,7 @@ def verify_databases():
     
     # Check appointments database
     try:
-        conn = sqlite3.connect('appointments.db')
+        conn = sqlite3.connect(APPOINTMENTS_DB_PATH)
         cursor = conn.cursor()
         
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
@@ -418,8 +515,12 @@ if __name__ == "__main__":
     print("🏥 Setting up Healthcare Appointment System Databases")
     print("=" * 60)
     
-    create_services_database()
-    create_appointments_database()
+    conn = open_setup_connection()
+    try:
+        create_services_database(conn)
+        create_appointments_database(conn)
+    finally:
+        conn.close()
     verify_databases()
     
     print("\n✅ Database setup complete!")
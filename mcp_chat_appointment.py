@@ -1,17 +1,25 @@
 import sqlite3
-import json
+import orjson
+import hashlib
 import logging
 import sys
 import os
+import re
 import asyncio
+import atexit
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
-import google.generativeai as genai
+import importlib
 import dotenv
 dotenv.load_dotenv()
 
 # Import MCP components
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Context
 from mcp.server.fastmcp.prompts.base import UserMessage, Message
 
 # ------------------------------------------------------------------------------
@@ -19,12 +27,197 @@ from mcp.server.fastmcp.prompts.base import UserMessage, Message
 # ------------------------------------------------------------------------------
 # Set your Gemini API key here or as environment variable
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "your-gemini-api-key-here")
-genai.configure(api_key=GEMINI_API_KEY)
+
+# The Gemini SDK pulls in a large import graph, so it is only loaded once the AI is first needed
+genai = None
+
+# Errors raised by Gemini for a rejected API key; filled in by load_genai()
+GEMINI_AUTH_ERRORS = ()
+
+# Caps reply length so a runaway generation cannot hold an executor thread for long; high enough
+# that a full doctor list or multi-step booking guidance is not cut off mid-reply
+GEMINI_MAX_OUTPUT_TOKENS = 1024
+GEMINI_GENERATION_CONFIG = {"max_output_tokens": GEMINI_MAX_OUTPUT_TOKENS}
+
+# Day names as stored in time_slots.day_of_week (Monday = 1)
+DAY_MAP = {"monday": 1, "tuesday": 2, "wednesday": 3, "thursday": 4, "friday": 5, "saturday": 6, "sunday": 7}
 
 # Database paths
 SERVICES_DB_PATH = "healthcare_services.db"
 APPOINTMENTS_DB_PATH = "appointments.db"
 
+# Long-lived connections kept open per database and shared across requests
+DB_POOL_SIZE = 4
+
+# WAL lets readers run alongside the booking writes; set SQLITE_WAL=0 so tests can override it with
+# the rollback journal, which also switches a database file that was left in WAL mode back
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") != "0"
+
+# The page cache and mmap keep hot tables in memory
+SQLITE_CONNECTION_PRAGMAS = (
+    'journal_mode=WAL' if SQLITE_WAL else 'journal_mode=DELETE',
+    'synchronous=NORMAL',
+    'temp_store=MEMORY',
+    'cache_size=-65536',
+    'mmap_size=268435456',
+    'foreign_keys=ON',
+)
+
+# Prepared statements kept per connection, so repeated tool queries skip re-parsing
+SQLITE_CACHED_STATEMENTS = 256
+
+# ------------------------------------------------------------------------------
+# Hot Query Templates
+# ------------------------------------------------------------------------------
+# Kept at module scope so every call hands sqlite3 the same SQL text and hits its statement cache
+ALL_SERVICES_SQL = """
+    SELECT s.*, c.name as clinic_name, c.address, c.phone as clinic_phone
+    FROM services s
+    JOIN clinics c ON s.clinic_id = c.id
+    ORDER BY s.department, s.name
+"""
+
+AVAILABLE_DOCTORS_SQL = """
+    SELECT d.*, c.name as clinic_name, c.address, c.operating_hours,
+           COALESCE(slot_counts.available_slots, 0) as available_slots_today
+    FROM doctors d
+    JOIN clinics c ON d.clinic_id = c.id
+    LEFT JOIN (
+        SELECT doctor_id, COUNT(*) as available_slots
+        FROM time_slots
+        WHERE day_of_week = ? AND is_available = 1
+        GROUP BY doctor_id
+    ) slot_counts ON slot_counts.doctor_id = d.id
+    ORDER BY d.specialty, d.name
+"""
+
+SEARCH_SERVICES_SQL = """
+    SELECT s.*, c.name as clinic_name, c.address, c.phone as clinic_phone,
+           d.name as doctor_name, d.specialty, d.working_hours_display
+    FROM services s
+    JOIN clinics c ON s.clinic_id = c.id
+    LEFT JOIN doctor_services ds ON s.id = ds.service_id
+    LEFT JOIN doctors d ON ds.doctor_id = d.id
+    WHERE s.name LIKE ? OR s.description LIKE ? OR s.department LIKE ?
+    ORDER BY s.department, s.name
+"""
+
+# Detail lookups for the ids listed in the compact AI context
+ENTITY_DETAILS_SQL = {
+    "service": """
+        SELECT s.*, c.name as clinic_name, c.address, c.phone as clinic_phone
+        FROM services s
+        JOIN clinics c ON s.clinic_id = c.id
+        WHERE s.id = ?
+    """,
+    "doctor": """
+        SELECT d.*, c.name as clinic_name, c.address, c.phone as clinic_phone
+        FROM doctors d
+        JOIN clinics c ON d.clinic_id = c.id
+        WHERE d.id = ?
+    """,
+    "clinic": "SELECT * FROM clinics WHERE id = ?",
+}
+
+# One fixed availability query; each filter is skipped when its parameter is NULL
+AVAILABILITY_SQL = """
+    SELECT ts.*, d.name as doctor_name, d.specialty, c.name as clinic_name
+    FROM time_slots ts
+    JOIN doctors d ON ts.doctor_id = d.id
+    JOIN clinics c ON d.clinic_id = c.id
+    WHERE ts.is_available = 1
+      AND (:doctor_id IS NULL OR ts.doctor_id = :doctor_id)
+      AND (:service_id IS NULL OR EXISTS (
+            SELECT 1 FROM doctor_services ds
+            WHERE ds.doctor_id = d.id AND ds.service_id = :service_id))
+      AND (:day_num IS NULL OR ts.day_of_week = :day_num)
+    ORDER BY ts.day_of_week, ts.start_time
+"""
+
+# Substring search through db_setup.py's trigram index (services_search), which matches the
+# same rows as the LIKE '%q%' scan above for terms of SEARCH_SERVICES_MIN_LENGTH or more characters
+SEARCH_SERVICES_MIN_LENGTH = 3
+SEARCH_SERVICES_FTS_SQL = """
+    SELECT s.*, c.name as clinic_name, c.address, c.phone as clinic_phone,
+           d.name as doctor_name, d.specialty, d.working_hours_display
+    FROM services_search f
+    JOIN services s ON s.id = f.rowid
+    JOIN clinics c ON s.clinic_id = c.id
+    LEFT JOIN doctor_services ds ON s.id = ds.service_id
+    LEFT JOIN doctors d ON ds.doctor_id = d.id
+    WHERE services_search MATCH ?
+    ORDER BY s.department, s.name
+"""
+
+# Startup row counts in one statement; a module constant keeps the text identical so the
+# connection's statement cache reuses the prepared statement on every call
+TABLE_COUNTS_SQL = """
+    SELECT 'services', COUNT(*) FROM services
+    UNION ALL SELECT 'doctors', COUNT(*) FROM doctors
+    UNION ALL SELECT 'clinics', COUNT(*) FROM clinics
+"""
+
+# Writes with a RETURNING clause hand their rows back instead of a rowcount
+RETURNING_PATTERN = re.compile(r"\bRETURNING\b", re.IGNORECASE)
+
+def fts_match_expression(query: str) -> str:
+    """Turn free text into a quoted FTS5 substring query, or "" when it is too short for trigrams"""
+    query = query.strip()
+    if len(query) < SEARCH_SERVICES_MIN_LENGTH:
+        return ""
+    # Quoting keeps user input from being parsed as FTS5 syntax
+    return '"{}"'.format(query.replace('"', '""'))
+
+# Conversation memory bounds: sessions kept (least recently used evicted) and messages kept per session
+MAX_SESSIONS = 1024
+HISTORY_MAX_MESSAGES = 10
+
+# Replies to stateless messages ("hi", "what services do you offer") are reused for this long
+RESPONSE_CACHE_TTL = 600
+RESPONSE_CACHE_MAX_ENTRIES = 512
+STATEFUL_MESSAGE_PATTERN = re.compile(r"\d|\b(?:book|my)\b")
+
+# A message repeated verbatim in the same session within this window gets the previous reply again
+REPEAT_WINDOW = 60
+REPEAT_MAX_SESSIONS = 256
+
+# Interaction logs are queued and written in batches by a background task
+LOG_FLUSH_INTERVAL = 1.0
+LOG_BATCH_SIZE = 500
+INTERACTION_LOG_INSERT_SQL = """
+    INSERT INTO interaction_logs 
+    (session_id, user_input, ai_response, conversation_step, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+# Compact one-line-per-row templates for the AI system context, rendered with str.format_map.
+# Contact details and descriptions stay in the prompt, since the model is called without tools;
+# clinic addresses are listed once per clinic and referenced from services and doctors by id.
+SERVICE_CONTEXT_TEMPLATE = "{id} | {name} | {department} | ₹{price} | {duration_minutes} | {clinic_id} | {description}"
+DOCTOR_CONTEXT_TEMPLATE = "{id} | {name} | {specialty} | {clinic_id} | {available_days} | {working_hours_display} | {phone}"
+CLINIC_CONTEXT_TEMPLATE = "{id} | {name} | {address}, {city}, {state} | {phone} | {operating_hours}"
+
+# Seconds a built AI context stays valid before it is rebuilt from the database
+CONTEXT_CACHE_TTL = 300
+# The terminal rebuilds the context in the background once it is this close to expiring
+CONTEXT_PREWARM_MARGIN = 60
+
+# Bumped by every write path so cached schema/context is invalidated on mutation
+SCHEMA_VERSION = 0
+
+def bump_schema_version():
+    """Invalidate cached schema and AI context after a database write"""
+    global SCHEMA_VERSION
+    SCHEMA_VERSION += 1
+
+# Non-string keys (e.g. day numbers) are accepted the way json.dumps accepts them
+DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS
+DUMPS_PRETTY_OPTIONS = DUMPS_OPTIONS | orjson.OPT_INDENT_2
+
+def dumps(obj, *, pretty: bool = False) -> str:
+    """Serialize tool, resource and prompt payloads with orjson"""
+    return orjson.dumps(obj, option=DUMPS_PRETTY_OPTIONS if pretty else DUMPS_OPTIONS).decode()
+
 # ------------------------------------------------------------------------------
 # Logging Setup
 # ------------------------------------------------------------------------------
@@ -39,145 +232,315 @@ logging.basicConfig(
 )
 logger = logging.getLogger("healthcare_gemini_mcp")
 
+def say(text: str):
+    """Write a block of terminal output in one call and flush it"""
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
 # ------------------------------------------------------------------------------
 # Database Manager Class
 # ------------------------------------------------------------------------------
 class DatabaseManager:
     def __init__(self):
-        self.services_conn = None
-        self.appointments_conn = None
+        self.pools = {}
+        self.fts_enabled = False
+        self._schema_cache = None
+        self._schema_version = None
         self.connect_databases()
     
+    def open_connection(self, path: str, attach: str = None):
+        """Open one pooled connection with proper configuration"""
+        conn = sqlite3.connect(path, check_same_thread=False, cached_statements=SQLITE_CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        if attach:
+            # Bookings touch time_slots and appointments in one transaction through the app schema
+            conn.execute("ATTACH DATABASE ? AS app", (attach,))
+        for pragma in SQLITE_CONNECTION_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma}")
+        return conn
+    
     def connect_databases(self):
-        """Connect to both databases with proper configuration"""
+        """Fill a connection pool for each database"""
         try:
-            self.services_conn = sqlite3.connect(SERVICES_DB_PATH, check_same_thread=False)
-            self.services_conn.row_factory = sqlite3.Row
+            for db, path, attach in (("services", SERVICES_DB_PATH, APPOINTMENTS_DB_PATH),
+                                     ("appointments", APPOINTMENTS_DB_PATH, None)):
+                pool = queue.Queue(maxsize=DB_POOL_SIZE)
+                for _ in range(DB_POOL_SIZE):
+                    pool.put(self.open_connection(path, attach))
+                self.pools[db] = pool
             
-            self.appointments_conn = sqlite3.connect(APPOINTMENTS_DB_PATH, check_same_thread=False)
-            self.appointments_conn.row_factory = sqlite3.Row
-            
-            logger.info(f"Connected to databases: {SERVICES_DB_PATH} and {APPOINTMENTS_DB_PATH}")
+            logger.info("Connected to databases: %s and %s (pool size %s)", SERVICES_DB_PATH, APPOINTMENTS_DB_PATH, DB_POOL_SIZE)
         except Exception as e:
-            logger.exception(f"Failed to connect to databases: {e}")
+            logger.exception("Failed to connect to databases: %s", e)
             raise
+        self.ensure_statistics()
+        self.detect_search_index()
+    
+    def ensure_statistics(self):
+        """Gather planner statistics for db_setup.py's indexes the first time, refreshing them afterwards"""
+        try:
+            with self.connection("services") as conn:
+                analyzed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+                conn.execute("ANALYZE main" if not analyzed else "PRAGMA optimize")
+        except sqlite3.Error as e:
+            logger.warning("Could not gather query planner statistics: %s", e)
+    
+    def detect_search_index(self):
+        """Use db_setup.py's trigram service index if it exists and this SQLite can read it, else LIKE search"""
+        try:
+            with self.connection("services") as conn:
+                # Preparing the statement fails when the table is missing or FTS5/trigram is not compiled in
+                conn.execute("SELECT rowid FROM services_search LIMIT 0")
+            self.fts_enabled = True
+        except sqlite3.Error as e:
+            logger.warning("Trigram service index unavailable, using LIKE search: %s", e)
+    
+    @contextmanager
+    def connection(self, db: str = "services"):
+        """Borrow a pooled connection, returning it to the pool afterwards"""
+        pool = self.pools[db]
+        conn = pool.get()
+        try:
+            yield conn
+        finally:
+            pool.put(conn)
+    
+    def close(self):
+        """Close every pooled connection"""
+        try:
+            for pool in self.pools.values():
+                while not pool.empty():
+                    pool.get_nowait().close()
+            logger.info("Database connections closed successfully.")
+        except Exception as e:
+            logger.warning("Error closing database connections: %s", e)
     
     def get_database_schema(self):
         """Dynamically get database schema for AI context"""
+        if self._schema_cache is not None and self._schema_version == SCHEMA_VERSION:
+            return self._schema_cache
         try:
             schema_info = {
                 "services_db": {},
                 "appointments_db": {}
             }
             
-            # Get services database schema
-            cursor = self.services_conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            for table_name in cursor.fetchall():
-                table = table_name[0]
-                cursor = self.services_conn.execute(f"PRAGMA table_info({table})")
-                schema_info["services_db"][table] = [dict(row) for row in cursor.fetchall()]
-            
-            # Get appointments database schema
-            cursor = self.appointments_conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            for table_name in cursor.fetchall():
-                table = table_name[0]
-                cursor = self.appointments_conn.execute(f"PRAGMA table_info({table})")
-                schema_info["appointments_db"][table] = [dict(row) for row in cursor.fetchall()]
+            for db in ("services", "appointments"):
+                with self.connection(db) as conn:
+                    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+                    for table_name in cursor.fetchall():
+                        table = table_name[0]
+                        cursor = conn.execute(f"PRAGMA table_info({table})")
+                        schema_info[f"{db}_db"][table] = [dict(row) for row in cursor.fetchall()]
             
+            self._schema_cache = schema_info
+            self._schema_version = SCHEMA_VERSION
             return schema_info
         except Exception as e:
-            logger.exception(f"Error getting database schema: {e}")
+            logger.exception("Error getting database schema: %s", e)
             return {}
     
-    def execute_dynamic_query(self, query: str, params: tuple = (), db: str = "services"):
+    def execute_dynamic_query(self, query: str, params: tuple | dict = (), db: str = "services", as_dicts: bool = True):
         """Execute dynamic queries safely"""
         try:
-            conn = self.services_conn if db == "services" else self.appointments_conn
-            cursor = conn.execute(query, params)
-            if query.strip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')):
-                conn.commit()
-                return cursor.rowcount
-            else:
-                return [dict(row) for row in cursor.fetchall()]
+            with self.connection(db) as conn:
+                # Fetch plain tuples and name the columns once per query instead of once per row
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                cursor.execute(query, params)
+                is_write = query.strip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))
+                if is_write and not RETURNING_PATTERN.search(query):
+                    conn.commit()
+                    return cursor.rowcount
+                rows = cursor.fetchall()
+                if is_write:
+                    # RETURNING rows must be fetched before the commit
+                    conn.commit()
+                if not as_dicts:
+                    return rows
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in rows]
         except Exception as e:
-            logger.exception(f"Error executing query: {e}")
+            logger.exception("Error executing query: %s", e)
             return []
+    
+    def execute_many(self, query: str, rows: list, db: str = "services"):
+        """Execute one statement for many parameter rows inside a single transaction"""
+        try:
+            with self.connection(db) as conn:
+                with conn:
+                    return conn.executemany(query, rows).rowcount
+        except Exception as e:
+            logger.exception("Error executing batch: %s", e)
+            return 0
+    
+    async def execute_async(self, query: str, params: tuple | dict = (), db: str = "services", as_dicts: bool = True):
+        """Run execute_dynamic_query in a worker thread so the event loop stays free"""
+        return await asyncio.to_thread(self.execute_dynamic_query, query, params, db, as_dicts)
+
+def missing_database_files() -> list:
+    """Return the database paths that do not exist, scanning each directory once"""
+    paths = (SERVICES_DB_PATH, APPOINTMENTS_DB_PATH)
+    present = set()
+    for db_dir in {os.path.dirname(os.path.abspath(path)) for path in paths}:
+        with os.scandir(db_dir) as entries:
+            present.update(os.path.join(db_dir, entry.name) for entry in entries)
+    return [path for path in paths if os.path.abspath(path) not in present]
 
-# Initialize database manager
+# Checked before connecting, since sqlite3.connect creates any file that is missing
+MISSING_DATABASE_FILES = missing_database_files()
+
+# Initialize database manager; its pools are closed at interpreter exit however the program ends
 db_manager = DatabaseManager()
+atexit.register(db_manager.close)
 
 # ------------------------------------------------------------------------------
 # Gemini AI Manager Class
 # ------------------------------------------------------------------------------
 class GeminiAIManager:
     def __init__(self):
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
-        self.conversation_history = {}
-        self.system_context = self.build_dynamic_context()
+        self.model = load_genai().GenerativeModel('gemini-1.5-flash', generation_config=GEMINI_GENERATION_CONFIG)
+        self.conversation_history = OrderedDict()
+        self._context_cache = None
+        self._context_key = None
+        self._context_ts = 0
+        self._context_ttl = CONTEXT_CACHE_TTL
+        self._response_cache = {}
+        self._fmt_cache = {}
+        self._session_locks = {}
+        self._last_turns = OrderedDict()
+        self._log_queue = None
+        self._log_task = None
+        self.system_context = "You are a healthcare appointment scheduling assistant."
+    
+    def get_history(self, session_id: str):
+        """Return the bounded history for a session, evicting the least recently used session when full"""
+        history = self.conversation_history.get(session_id)
+        if history is None:
+            history = self.conversation_history[session_id] = deque(maxlen=HISTORY_MAX_MESSAGES)
+            if len(self.conversation_history) > MAX_SESSIONS:
+                evicted_id, _ = self.conversation_history.popitem(last=False)
+                self.drop_session_lock(evicted_id)
+        else:
+            self.conversation_history.move_to_end(session_id)
+        return history
+    
+    def drop_session_lock(self, session_id: str):
+        """Forget a session's lock unless a turn is still holding it"""
+        lock = self._session_locks.get(session_id)
+        if lock is not None and not lock.locked():
+            del self._session_locks[session_id]
+    
+    def reset_session(self, session_id: str):
+        """Discard a session's history and lock"""
+        self.conversation_history.pop(session_id, None)
+        self._last_turns.pop(session_id, None)
+        self.drop_session_lock(session_id)
+    
+    def repeat_key(self, user_message: str) -> str:
+        """Digest of a message as typed, tied to the current data version"""
+        return hashlib.blake2b(f"{SCHEMA_VERSION}:{user_message.strip()}".encode(), digest_size=16).hexdigest()
     
-    def build_dynamic_context(self):
+    def remember_turn(self, session_id: str, key: str, ai_response: str):
+        """Record a session's latest exchange, forgetting the least recently active session when full"""
+        self._last_turns.pop(session_id, None)
+        if len(self._last_turns) >= REPEAT_MAX_SESSIONS:
+            self._last_turns.popitem(last=False)
+        self._last_turns[session_id] = (key, ai_response, time.monotonic())
+    
+    def response_cache_key(self, user_message: str, history):
+        """Cache key for a normalized message, or None when the reply depends on conversation state"""
+        if history:
+            return None
+        normalized = re.sub(r"\W+", " ", user_message.lower()).strip()
+        if not normalized or STATEFUL_MESSAGE_PATTERN.search(normalized):
+            return None
+        return hashlib.blake2b(f"{SCHEMA_VERSION}:{normalized}".encode(), digest_size=16).hexdigest()
+    
+    def cache_response(self, key: str, ai_response: str):
+        """Store a reply, dropping the oldest entry once the cache is full"""
+        self._response_cache.pop(key, None)
+        if len(self._response_cache) >= RESPONSE_CACHE_MAX_ENTRIES:
+            self._response_cache.pop(next(iter(self._response_cache)))
+        self._response_cache[key] = (time.monotonic(), ai_response)
+    
+    def log_interaction(self, session_id: str, user_message: str, ai_response: str):
+        """Queue one chat exchange for interaction_logs, starting the flusher on first use"""
+        if self._log_task is None or self._log_task.done():
+            self._log_queue = asyncio.Queue()
+            self._log_task = asyncio.create_task(self.flush_interaction_logs())
+        self._log_queue.put_nowait((session_id, user_message, ai_response, "conversation", datetime.now().isoformat()))
+    
+    async def flush_interaction_logs(self):
+        """Background task writing queued interaction logs in batched transactions"""
+        rows = []
+        try:
+            while True:
+                rows.append(await self._log_queue.get())
+                await asyncio.sleep(LOG_FLUSH_INTERVAL)
+                while len(rows) < LOG_BATCH_SIZE and not self._log_queue.empty():
+                    rows.append(self._log_queue.get_nowait())
+                batch, rows = rows, []
+                await asyncio.to_thread(db_manager.execute_many, INTERACTION_LOG_INSERT_SQL, batch, "appointments")
+        finally:
+            # Write whatever is still pending so shutdown does not drop logs
+            while not self._log_queue.empty():
+                rows.append(self._log_queue.get_nowait())
+            if rows:
+                db_manager.execute_many(INTERACTION_LOG_INSERT_SQL, rows, "appointments")
+    
+    def render_rows(self, entity: str, template: str, rows: list):
+        """Render rows through a template, reusing text for rows unchanged since the last build"""
+        cache = self._fmt_cache.get(entity, {})
+        rendered = {}
+        for row in rows:
+            key = (row['id'], hash(tuple(row.values())))
+            text = cache.get(key)
+            rendered[key] = text if text is not None else template.format_map(row)
+        # Keep only the current rows so edited or removed rows do not pile up
+        self._fmt_cache[entity] = rendered
+        return "\n".join(rendered.values())
+    
+    async def build_dynamic_context(self):
         """Build dynamic system context based on current database state"""
+        if (self._context_cache is not None and self._context_key == SCHEMA_VERSION
+                and time.monotonic() - self._context_ts < self._context_ttl):
+            return self._context_cache
         try:
-            # Get current database schema
-            schema = db_manager.get_database_schema()
-            
-            # Get current services
-            services = db_manager.execute_dynamic_query("""
-                SELECT s.id, s.name, s.description, s.duration_minutes, s.price, s.department,
-                       c.name as clinic_name, c.address, c.operating_hours
-                FROM services s
-                JOIN clinics c ON s.clinic_id = c.id
-                ORDER BY s.department, s.name
-            """)
-            
-            # Get current doctors
-            doctors = db_manager.execute_dynamic_query("""
-                SELECT d.id, d.name, d.specialty, d.phone, d.working_hours_display,
-                       c.name as clinic_name, d.available_days
-                FROM doctors d
-                JOIN clinics c ON d.clinic_id = c.id
-                ORDER BY d.specialty, d.name
-            """)
-            
-            # Get current clinics
-            clinics = db_manager.execute_dynamic_query("""
-                SELECT id, name, address, city, state, phone, operating_hours
-                FROM clinics
-                ORDER BY name
-            """)
-            
-            services_text = "\n".join([
-                f"• {s['name']} - {s['department']} - ₹{s['price']} ({s['duration_minutes']} mins)\n"
-                f"  Description: {s['description']}\n"
-                f"  Available at: {s['clinic_name']} - {s['address']}"
-                for s in services
-            ])
-            
-            doctors_text = "\n".join([
-                f"• Dr. {d['name']} - {d['specialty']}\n"
-                f"  Working Hours: {d['working_hours_display']}\n"
-                f"  Available Days: {d['available_days']}\n"
-                f"  Contact: {d['phone']} | Clinic: {d['clinic_name']}"
-                for d in doctors
-            ])
+            # Services, doctors and clinics are independent reads, so run them concurrently
+            services, doctors, clinics = await asyncio.gather(
+                db_manager.execute_async("""
+                    SELECT id, name, department, price, duration_minutes, clinic_id, description
+                    FROM services
+                    ORDER BY department, name
+                """),
+                db_manager.execute_async("""
+                    SELECT id, name, specialty, clinic_id, working_hours_display, phone,
+                           replace(replace(replace(available_days, '"', ''), '[', ''), ']', '') as available_days
+                    FROM doctors
+                    ORDER BY specialty, name
+                """),
+                db_manager.execute_async("""
+                    SELECT id, name, address, city, state, phone, operating_hours
+                    FROM clinics
+                    ORDER BY name
+                """),
+            )
             
-            clinics_text = "\n".join([
-                f"• {c['name']}\n"
-                f"  Address: {c['address']}, {c['city']}, {c['state']}\n"
-                f"  Phone: {c['phone']} | Hours: {c['operating_hours']}"
-                for c in clinics
-            ])
+            services_text = self.render_rows("service", SERVICE_CONTEXT_TEMPLATE, services)
+            doctors_text = self.render_rows("doctor", DOCTOR_CONTEXT_TEMPLATE, doctors)
+            clinics_text = self.render_rows("clinic", CLINIC_CONTEXT_TEMPLATE, clinics)
             
             context = f"""
 You are HEALTHBOT AI, an intelligent healthcare appointment scheduling assistant for multiple clinics in Karimnagar, Telangana, India.
 
-🏥 CURRENT HEALTHCARE FACILITIES:
+🏥 CLINICS (id | name | address | phone | hours):
 {clinics_text}
 
-👩‍⚕️ AVAILABLE DOCTORS:
+👩‍⚕️ DOCTORS (id | name | specialty | clinic id | days | hours | phone):
 {doctors_text}
 
-🩺 AVAILABLE SERVICES:
+🩺 SERVICES (id | name | department | price | minutes | clinic id | description):
 {services_text}
 
 🎯 YOUR PRIMARY RESPONSIBILITIES:
@@ -222,59 +585,143 @@ You are HEALTHBOT AI, an intelligent healthcare appointment scheduling assistant
 
 Always start conversations with a warm greeting and ask how you can help with their healthcare needs today.
 """
+            self._context_cache = context
+            self._context_key = SCHEMA_VERSION
+            self._context_ts = time.monotonic()
             return context
             
         except Exception as e:
-            logger.exception(f"Error building dynamic context: {e}")
+            logger.exception("Error building dynamic context: %s", e)
             return "You are a healthcare appointment scheduling assistant."
     
-    async def generate_response(self, user_message: str, session_id: str = "default", context_data: dict = None):
+    async def prewarm_context(self):
+        """Rebuild the context ahead of expiry so the next turn does not wait on the database"""
+        age = time.monotonic() - self._context_ts
+        if self._context_key == SCHEMA_VERSION and age < self._context_ttl - CONTEXT_PREWARM_MARGIN:
+            return
+        self._context_cache = None
+        self.system_context = await self.build_dynamic_context()
+    
+    async def stream_completion(self, prompt: str, on_chunk=None):
+        """Stream a Gemini completion from a worker thread, passing each text chunk to on_chunk as it arrives"""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        
+        def produce():
+            try:
+                for chunk in self.model.generate_content(prompt, stream=True):
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk.text)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+        
+        producer = loop.run_in_executor(None, produce)
+        parts = []
+        while (text := await chunks.get()) is not None:
+            parts.append(text)
+            if on_chunk:
+                on_chunk(text)
+        await producer  # Surface any error raised by the stream
+        return "".join(parts)
+    
+    async def generate_response(self, user_message: str, session_id: str = "default", context_data: dict = None, on_chunk=None):
         """Generate AI response using Gemini with conversation history"""
-        try:
-            # Initialize conversation history for new sessions
-            if session_id not in self.conversation_history:
-                self.conversation_history[session_id] = []
-            
-            # Add current database context if provided
-            enhanced_context = self.system_context
-            if context_data:
-                enhanced_context += f"\n\nCURRENT DATABASE CONTEXT:\n{json.dumps(context_data, indent=2)}"
-            
-            # Build conversation prompt
-            conversation_prompt = f"{enhanced_context}\n\n"
-            
-            # Add conversation history
-            for msg in self.conversation_history[session_id][-10:]:  # Keep last 10 messages
-                conversation_prompt += f"{msg}\n"
-            
-            conversation_prompt += f"Patient: {user_message}\nHealthBot AI: "
-            
-            # Generate response
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, self.model.generate_content, conversation_prompt
-            )
-            
-            ai_response = response.text
-            
-            # Update conversation history
-            self.conversation_history[session_id].append(f"Patient: {user_message}")
-            self.conversation_history[session_id].append(f"HealthBot AI: {ai_response}")
-            
-            # Log interaction
-            db_manager.execute_dynamic_query("""
-                INSERT INTO interaction_logs 
-                (session_id, user_input, ai_response, conversation_step, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            """, (session_id, user_message, ai_response, "conversation", datetime.now().isoformat()), "appointments")
-            
-            return ai_response
-            
-        except Exception as e:
-            logger.exception(f"Error generating AI response: {e}")
-            return "I apologize, but I'm having trouble processing your request right now. Please try again or contact our clinic directly."
+        # Serialize turns within a session so history reads and appends never interleave
+        async with self._session_locks.setdefault(session_id, asyncio.Lock()):
+            try:
+                # Initialize conversation history for new sessions
+                history = self.get_history(session_id)
+                
+                # An identical message retyped right away gets the same reply without calling Gemini
+                repeat_key = self.repeat_key(user_message)
+                last_turn = self._last_turns.get(session_id)
+                if last_turn and last_turn[0] == repeat_key and time.monotonic() - last_turn[2] < REPEAT_WINDOW:
+                    logger.info("Repeated message for session %s, reusing last reply", session_id)
+                    self.log_interaction(session_id, user_message, last_turn[1])
+                    if on_chunk:
+                        on_chunk(last_turn[1])
+                    return last_turn[1]
+                
+                # Stateless messages can be answered from the response cache without calling Gemini
+                cache_key = self.response_cache_key(user_message, history)
+                cached = self._response_cache.get(cache_key) if cache_key else None
+                if cached and time.monotonic() - cached[0] < RESPONSE_CACHE_TTL:
+                    logger.info("Response cache hit for session %s", session_id)
+                    # The cached exchange still becomes part of the conversation, so follow-ups keep their context
+                    history.append(f"Patient: {user_message}")
+                    history.append(f"HealthBot AI: {cached[1]}")
+                    self.remember_turn(session_id, repeat_key, cached[1])
+                    self.log_interaction(session_id, user_message, cached[1])
+                    if on_chunk:
+                        on_chunk(cached[1])
+                    return cached[1]
+                
+                # Add current database context if provided
+                self.system_context = await self.build_dynamic_context()
+                enhanced_context = self.system_context
+                if context_data:
+                    enhanced_context += f"\n\nCURRENT DATABASE CONTEXT:\n{dumps(context_data, pretty=True)}"
+                
+                # Build conversation prompt
+                conversation_prompt = f"{enhanced_context}\n\n"
+                
+                # Add conversation history
+                for msg in history:  # Deque keeps only the last HISTORY_MAX_MESSAGES
+                    conversation_prompt += f"{msg}\n"
+                
+                conversation_prompt += f"Patient: {user_message}\nHealthBot AI: "
+                
+                # Generate response; history is only updated once the stream completes
+                ai_response = await self.stream_completion(conversation_prompt, on_chunk)
+                
+                # Update conversation history
+                history.append(f"Patient: {user_message}")
+                history.append(f"HealthBot AI: {ai_response}")
+                
+                if cache_key:
+                    self.cache_response(cache_key, ai_response)
+                self.remember_turn(session_id, repeat_key, ai_response)
+                
+                # Log interaction (written by the background flusher)
+                self.log_interaction(session_id, user_message, ai_response)
+                
+                return ai_response
+                
+            except GEMINI_AUTH_ERRORS as e:
+                # There is no startup ping, so a bad key first shows up on a real turn
+                logger.error("Gemini rejected the API key: %s", e)
+                return "❌ The AI service rejected the configured Gemini API key. Please check GEMINI_API_KEY and restart the assistant."
+            except Exception as e:
+                logger.exception("Error generating AI response: %s", e)
+                return "I apologize, but I'm having trouble processing your request right now. Please try again or contact our clinic directly."
+
+# AI manager is built on first use; importers can still reach it as module.ai_manager
+_ai_manager = None
+_ai_manager_lock = threading.Lock()
+
+def load_genai():
+    """Import and configure google.generativeai on first use"""
+    global genai, GEMINI_AUTH_ERRORS
+    if genai is None:
+        module = importlib.import_module("google.generativeai")
+        module.configure(api_key=GEMINI_API_KEY)
+        api_errors = importlib.import_module("google.api_core.exceptions")
+        GEMINI_AUTH_ERRORS = (api_errors.Unauthenticated, api_errors.PermissionDenied)
+        genai = module
+    return genai
 
-# Initialize AI manager
-ai_manager = GeminiAIManager()
+def get_ai_manager() -> GeminiAIManager:
+    """Return the shared AI manager, creating it (and loading the Gemini SDK) on first call"""
+    global _ai_manager
+    if _ai_manager is None:
+        with _ai_manager_lock:
+            if _ai_manager is None:
+                _ai_manager = GeminiAIManager()
+    return _ai_manager
+
+def __getattr__(name: str):
+    if name == "ai_manager":
+        return get_ai_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ------------------------------------------------------------------------------
 # MCP Server Initialization
@@ -286,54 +733,37 @@ mcp = FastMCP("Healthcare Gemini AI Assistant")
 # ------------------------------------------------------------------------------
 
 @mcp.resource("healthcare://services/all")
-def get_all_services() -> str:
+async def get_all_services() -> str:
     """Get all available healthcare services with real-time data"""
     logger.info("Fetching all healthcare services")
     try:
-        services = db_manager.execute_dynamic_query("""
-            SELECT s.*, c.name as clinic_name, c.address, c.phone as clinic_phone
-            FROM services s
-            JOIN clinics c ON s.clinic_id = c.id
-            ORDER BY s.department, s.name
-        """)
-        return json.dumps(services, indent=2)
+        services = await db_manager.execute_async(ALL_SERVICES_SQL)
+        return dumps(services, pretty=True)
     except Exception as e:
-        logger.exception(f"Error retrieving services: {e}")
-        return json.dumps({"error": str(e)})
+        logger.exception("Error retrieving services: %s", e)
+        return dumps({"error": str(e)})
 
 @mcp.resource("healthcare://doctors/available")
-def get_available_doctors() -> str:
+async def get_available_doctors() -> str:
     """Get all doctors with their current availability"""
     logger.info("Fetching available doctors")
     try:
-        doctors = db_manager.execute_dynamic_query("""
-            SELECT d.*, c.name as clinic_name, c.address, c.operating_hours
-            FROM doctors d
-            JOIN clinics c ON d.clinic_id = c.id
-            ORDER BY d.specialty, d.name
-        """)
+        # Count today's open slots for every doctor in the same query
+        # time_slots numbers days 1 (Monday) to 7 (Sunday), matching isoweekday()
+        today = datetime.now().isoweekday()
+        doctors = await db_manager.execute_async(AVAILABLE_DOCTORS_SQL, (today,))
         
-        # Add current time slot availability
-        for doctor in doctors:
-            today = datetime.now().strftime('%w')  # Get day of week
-            slots = db_manager.execute_dynamic_query("""
-                SELECT COUNT(*) as available_slots
-                FROM time_slots
-                WHERE doctor_id = ? AND day_of_week = ? AND is_available = 1
-            """, (doctor['id'], today))
-            doctor['available_slots_today'] = slots[0]['available_slots'] if slots else 0
-        
-        return json.dumps(doctors, indent=2)
+        return dumps(doctors, pretty=True)
     except Exception as e:
-        logger.exception(f"Error retrieving doctors: {e}")
-        return json.dumps({"error": str(e)})
+        logger.exception("Error retrieving doctors: %s", e)
+        return dumps({"error": str(e)})
 
 @mcp.resource("healthcare://clinics/all")
-def get_all_clinics() -> str:
+async def get_all_clinics() -> str:
     """Get all clinic information"""
     logger.info("Fetching all clinics")
     try:
-        clinics = db_manager.execute_dynamic_query("""
+        clinics = await db_manager.execute_async("""
             SELECT c.*,
                    COUNT(DISTINCT d.id) as doctor_count,
                    COUNT(DISTINCT s.id) as service_count
@@ -343,33 +773,50 @@ def get_all_clinics() -> str:
             GROUP BY c.id
             ORDER BY c.name
         """)
-        return json.dumps(clinics, indent=2)
+        return dumps(clinics, pretty=True)
     except Exception as e:
-        logger.exception(f"Error retrieving clinics: {e}")
-        return json.dumps({"error": str(e)})
+        logger.exception("Error retrieving clinics: %s", e)
+        return dumps({"error": str(e)})
 
 # ------------------------------------------------------------------------------
 # Intelligent MCP Tools
 # ------------------------------------------------------------------------------
 
 @mcp.tool()
-async def chat_with_ai(user_message: str, session_id: str = "default") -> str:
+async def chat_with_ai(user_message: str, session_id: str = "default", ctx: Context = None) -> str:
     """Main chat interface with Gemini AI"""
-    logger.info(f"Processing chat message for session {session_id}")
+    logger.info("Processing chat message for session %s", session_id)
     try:
-        # Get fresh database context
+        # Services, doctors and clinics are already in the cached system context by id,
+        # so only the per-request time context is added here
         context_data = {
-            "available_services": db_manager.execute_dynamic_query("SELECT id, name, department FROM services ORDER BY name"),
-            "available_doctors": db_manager.execute_dynamic_query("SELECT id, name, specialty FROM doctors ORDER BY name"),
-            "clinics": db_manager.execute_dynamic_query("SELECT id, name, phone FROM clinics ORDER BY name"),
             "current_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "day_of_week": datetime.now().strftime("%A")
         }
         
-        # Generate AI response
-        ai_response = await ai_manager.generate_response(user_message, session_id, context_data)
+        # Stream reply text to the client as log notifications while it is generated;
+        # one forwarding task keeps the chunks in order
+        chunks = asyncio.Queue()
+        
+        async def forward_chunks():
+            while (text := await chunks.get()) is not None:
+                try:
+                    await ctx.info(text)
+                except Exception as e:
+                    logger.warning("Could not stream chat chunk to client: %s", e)
         
-        return json.dumps({
+        forwarder = asyncio.create_task(forward_chunks()) if ctx else None
+        try:
+            # Generate AI response
+            ai_response = await get_ai_manager().generate_response(
+                user_message, session_id, context_data, on_chunk=chunks.put_nowait if ctx else None
+            )
+        finally:
+            if forwarder:
+                chunks.put_nowait(None)
+                await forwarder
+        
+        return dumps({
             "success": True,
             "response": ai_response,
             "session_id": session_id,
@@ -377,93 +824,90 @@ async def chat_with_ai(user_message: str, session_id: str = "default") -> str:
         })
         
     except Exception as e:
-        logger.exception(f"Error in chat_with_ai: {e}")
-        return json.dumps({
+        logger.exception("Error in chat_with_ai: %s", e)
+        return dumps({
             "success": False,
             "error": str(e),
             "fallback_response": "I'm sorry, I'm having technical difficulties. Please try again or contact our clinic directly."
         })
 
 @mcp.tool()
-def search_services_intelligent(query: str) -> str:
+async def get_entity_details(entity_type: str, entity_id: int) -> str:
+    """Get full details (contact, address, description) for one service, doctor or clinic by id"""
+    logger.info("Fetching %s details for id %s", entity_type, entity_id)
+    try:
+        query = ENTITY_DETAILS_SQL.get(entity_type.lower())
+        if not query:
+            return dumps({"error": f"Unknown entity type '{entity_type}', expected one of: {', '.join(ENTITY_DETAILS_SQL)}"})
+        
+        details = await db_manager.execute_async(query, (entity_id,))
+        if not details:
+            return dumps({"error": f"No {entity_type} found with id {entity_id}"})
+        return dumps(details[0], pretty=True)
+        
+    except Exception as e:
+        logger.exception("Error fetching entity details: %s", e)
+        return dumps({"error": str(e)})
+
+@mcp.tool()
+async def search_services_intelligent(query: str) -> str:
     """Intelligent service search with symptom matching"""
-    logger.info(f"Intelligent search for: {query}")
+    logger.info("Intelligent search for: %s", query)
     try:
         # Search in name, description, and department
-        services = db_manager.execute_dynamic_query("""
-            SELECT s.*, c.name as clinic_name, c.address, c.phone as clinic_phone,
-                   d.name as doctor_name, d.specialty, d.working_hours_display
-            FROM services s
-            JOIN clinics c ON s.clinic_id = c.id
-            LEFT JOIN doctor_services ds ON s.id = ds.service_id
-            LEFT JOIN doctors d ON ds.doctor_id = d.id
-            WHERE s.name LIKE ? OR s.description LIKE ? OR s.department LIKE ?
-            ORDER BY s.department, s.name
-        """, (f"%{query}%", f"%{query}%", f"%{query}%"))
+        match = fts_match_expression(query)
+        if db_manager.fts_enabled and match:
+            services = await db_manager.execute_async(SEARCH_SERVICES_FTS_SQL, (match,))
+        else:
+            services = await db_manager.execute_async(SEARCH_SERVICES_SQL, (f"%{query}%", f"%{query}%", f"%{query}%"))
         
-        return json.dumps({
+        return dumps({
             "query": query,
             "results": services,
             "count": len(services)
-        }, indent=2)
+        }, pretty=True)
         
     except Exception as e:
-        logger.exception(f"Error in intelligent search: {e}")
-        return json.dumps({"error": str(e)})
+        logger.exception("Error in intelligent search: %s", e)
+        return dumps({"error": str(e)})
 
 @mcp.tool()
-def get_real_time_availability(doctor_id: int = None, service_id: int = None, day_preference: str = None) -> str:
+async def get_real_time_availability(doctor_id: int = None, service_id: int = None, day_preference: str = None) -> str:
     """Get real-time availability based on current database state"""
-    logger.info(f"Getting availability - doctor: {doctor_id}, service: {service_id}, day: {day_preference}")
+    logger.info("Getting availability - doctor: %s, service: %s, day: %s", doctor_id, service_id, day_preference)
     try:
-        query_parts = ["SELECT DISTINCT ts.*, d.name as doctor_name, d.specialty, c.name as clinic_name"]
-        from_parts = ["FROM time_slots ts"]
-        join_parts = ["JOIN doctors d ON ts.doctor_id = d.id", "JOIN clinics c ON d.clinic_id = c.id"]
-        where_parts = ["ts.is_available = 1"]
-        params = []
-        
-        if doctor_id:
-            where_parts.append("ts.doctor_id = ?")
-            params.append(doctor_id)
-        
-        if service_id:
-            join_parts.append("JOIN doctor_services ds ON d.id = ds.doctor_id")
-            where_parts.append("ds.service_id = ?")
-            params.append(service_id)
-        
-        if day_preference:
-            day_mapping = {"monday": 1, "tuesday": 2, "wednesday": 3, "thursday": 4, "friday": 5, "saturday": 6, "sunday": 7}
-            day_num = day_mapping.get(day_preference.lower())
-            if day_num:
-                where_parts.append("ts.day_of_week = ?")
-                params.append(day_num)
-        
-        query = f"{' '.join(query_parts)} {' '.join(from_parts)} {' '.join(join_parts)} WHERE {' AND '.join(where_parts)} ORDER BY ts.day_of_week, ts.start_time"
+        # Unset or unknown filters bind NULL, which disables that predicate
+        params = {
+            "doctor_id": doctor_id or None,
+            "service_id": service_id or None,
+            "day_num": DAY_MAP.get(day_preference.lower()) if day_preference else None,
+        }
         
-        availability = db_manager.execute_dynamic_query(query, tuple(params))
+        availability = await db_manager.execute_async(AVAILABILITY_SQL, params)
         
-        return json.dumps({
+        return dumps({
             "availability": availability,
             "total_slots": len(availability),
             "query_params": {"doctor_id": doctor_id, "service_id": service_id, "day_preference": day_preference}
-        }, indent=2)
+        }, pretty=True)
         
     except Exception as e:
-        logger.exception(f"Error getting availability: {e}")
-        return json.dumps({"error": str(e)})
+        logger.exception("Error getting availability: %s", e)
+        return dumps({"error": str(e)})
 
 @mcp.tool()
-def create_patient_intelligent(patient_data: str) -> str:
+async def create_patient_intelligent(patient_data: str) -> str:
     """Create patient with intelligent data parsing"""
     logger.info("Creating patient with intelligent parsing")
     try:
         # Parse JSON patient data
-        data = json.loads(patient_data) if isinstance(patient_data, str) else patient_data
+        data = orjson.loads(patient_data) if isinstance(patient_data, str) else patient_data
         
-        # Insert patient
-        result = db_manager.execute_dynamic_query("""
+        # Insert patient and get the created row back in the same statement
+        patient = await db_manager.execute_async("""
             INSERT INTO patients (name, phone, email, age, gender, address, medical_history, emergency_contact)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING *
         """, (
             data.get('name'),
             data.get('phone'),
@@ -474,28 +918,24 @@ def create_patient_intelligent(patient_data: str) -> str:
             data.get('medical_history'),
             data.get('emergency_contact')
         ), "appointments")
+        bump_schema_version()
         
-        # Get the created patient
-        patient = db_manager.execute_dynamic_query("""
-            SELECT * FROM patients WHERE rowid = last_insert_rowid()
-        """, (), "appointments")
-        
-        return json.dumps({
+        return dumps({
             "success": True,
             "patient": patient[0] if patient else {},
             "message": f"Patient {data.get('name')} created successfully"
         })
         
     except Exception as e:
-        logger.exception(f"Error creating patient: {e}")
-        return json.dumps({"success": False, "error": str(e)})
+        logger.exception("Error creating patient: %s", e)
+        return dumps({"success": False, "error": str(e)})
 
 @mcp.tool()
-def book_appointment_intelligent(booking_data: str) -> str:
+async def book_appointment_intelligent(booking_data: str) -> str:
     """Intelligent appointment booking with full validation"""
     logger.info("Processing intelligent appointment booking")
     try:
-        data = json.loads(booking_data) if isinstance(booking_data, str) else booking_data
+        data = orjson.loads(booking_data) if isinstance(booking_data, str) else booking_data
         
         patient_id = data.get('patient_id')
         doctor_id = data.get('doctor_id')
@@ -503,41 +943,50 @@ def book_appointment_intelligent(booking_data: str) -> str:
         time_slot_id = data.get('time_slot_id')
         appointment_date = data.get('appointment_date', datetime.now().strftime('%Y-%m-%d'))
         
-        # Validate time slot availability
-        slot_check = db_manager.execute_dynamic_query("""
-            SELECT ts.*, d.name as doctor_name, s.name as service_name, c.name as clinic_name
-            FROM time_slots ts
-            JOIN doctors d ON ts.doctor_id = d.id
-            LEFT JOIN services s ON ? = s.id
-            JOIN clinics c ON d.clinic_id = c.id
-            WHERE ts.id = ? AND ts.is_available = 1
-        """, (service_id, time_slot_id))
-        
-        if not slot_check:
-            return json.dumps({"success": False, "error": "Time slot not available"})
+        def claim_slot_and_book():
+            # Claim the slot and insert the appointment in one transaction; the is_available
+            # predicate makes the claim atomic, so two patients can never book the same slot
+            with db_manager.connection("services") as conn:
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    claimed = conn.execute("""
+                        UPDATE time_slots SET is_available = 0 WHERE id = ? AND is_available = 1
+                    """, (time_slot_id,)).rowcount
+                    if claimed != 1:
+                        return None, None
+                    
+                    slot_info = conn.execute("""
+                        SELECT ts.*, d.name as doctor_name, d.clinic_id, s.name as service_name, c.name as clinic_name
+                        FROM time_slots ts
+                        JOIN doctors d ON ts.doctor_id = d.id
+                        LEFT JOIN services s ON ? = s.id
+                        JOIN clinics c ON d.clinic_id = c.id
+                        WHERE ts.id = ?
+                    """, (service_id, time_slot_id)).fetchone()
+                    
+                    # Create appointment; a failed insert rolls the slot claim back with it
+                    appointment = conn.execute("""
+                        INSERT INTO app.appointments 
+                        (patient_id, doctor_id, service_id, clinic_id, appointment_date, appointment_time, 
+                         duration_minutes, patient_complaint, symptoms_description, urgency_level, status)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'scheduled')
+                        RETURNING id
+                    """, (
+                        patient_id, doctor_id, service_id, slot_info['clinic_id'],
+                        appointment_date, slot_info['start_time'], 30,  # Default duration
+                        data.get('complaint', ''), data.get('symptoms', ''), data.get('urgency', 'normal')
+                    )).fetchall()
+                    return slot_info, appointment[0]['id']
         
-        slot_info = slot_check[0]
+        slot_info, appointment_id = await asyncio.to_thread(claim_slot_and_book)
+        if slot_info is None:
+            return dumps({"success": False, "error": "Time slot not available"})
+        bump_schema_version()
         
-        # Create appointment
-        db_manager.execute_dynamic_query("""
-            INSERT INTO appointments 
-            (patient_id, doctor_id, service_id, clinic_id, appointment_date, appointment_time, 
-             duration_minutes, patient_complaint, symptoms_description, urgency_level, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'scheduled')
-        """, (
-            patient_id, doctor_id, service_id, 1,  # Default clinic_id, should be dynamic
-            appointment_date, slot_info['start_time'], 30,  # Default duration
-            data.get('complaint', ''), data.get('symptoms', ''), data.get('urgency', 'normal')
-        ), "appointments")
-        
-        # Mark time slot as unavailable
-        db_manager.execute_dynamic_query("""
-            UPDATE time_slots SET is_available = 0 WHERE id = ?
-        """, (time_slot_id,))
-        
-        return json.dumps({
+        return dumps({
             "success": True,
             "appointment_details": {
+                "appointment_id": appointment_id,
                 "doctor": slot_info['doctor_name'],
                 "service": slot_info['service_name'],
                 "clinic": slot_info['clinic_name'],
@@ -549,28 +998,29 @@ def book_appointment_intelligent(booking_data: str) -> str:
         })
         
     except Exception as e:
-        logger.exception(f"Error booking appointment: {e}")
-        return json.dumps({"success": False, "error": str(e)})
+        logger.exception("Error booking appointment: %s", e)
+        return dumps({"success": False, "error": str(e)})
 
 # ------------------------------------------------------------------------------
 # Advanced MCP Prompts
 # ------------------------------------------------------------------------------
 
 @mcp.prompt()
-def healthcare_system_prompt() -> list[Message]:
+async def healthcare_system_prompt() -> list[Message]:
     """Comprehensive system prompt with dynamic database context"""
     try:
-        # Refresh context with current database state
-        ai_manager.system_context = ai_manager.build_dynamic_context()
+        # Refresh context with current database state (served from cache when fresh)
+        ai_manager = get_ai_manager()
+        ai_manager.system_context = await ai_manager.build_dynamic_context()
         return [UserMessage(ai_manager.system_context)]
     except Exception as e:
-        logger.exception(f"Error generating system prompt: {e}")
+        logger.exception("Error generating system prompt: %s", e)
         return [UserMessage("You are a healthcare appointment scheduling assistant.")]
 
 @mcp.prompt()
-def analyze_patient_symptoms(symptoms: str, patient_info: str = "") -> list[Message]:
+async def analyze_patient_symptoms(symptoms: str, patient_info: str = "") -> list[Message]:
     """Advanced symptom analysis prompt"""
-    current_services = db_manager.execute_dynamic_query("""
+    current_services = await db_manager.execute_async("""
         SELECT name, description, department FROM services ORDER BY department
     """)
     
@@ -601,180 +1051,305 @@ def analyze_patient_symptoms(symptoms: str, patient_info: str = "") -> list[Mess
 # ------------------------------------------------------------------------------
 # Main Chat Interface for Terminal
 # ------------------------------------------------------------------------------
+async def read_user_input(prompt: str) -> str:
+    """Read a terminal line on a daemon thread so background tasks keep running while the user types"""
+    loop = asyncio.get_running_loop()
+    line = loop.create_future()
+    
+    def settle(setter, value):
+        if not line.done():
+            setter(value)
+    
+    def read():
+        try:
+            text = input(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(settle, line.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(settle, line.set_result, text)
+    
+    # A daemon thread (not the default executor) so a pending read never blocks interpreter shutdown
+    threading.Thread(target=read, daemon=True).start()
+    return await line
+
+async def print_streamed_response(user_message: str, session_id: str):
+    """Print the AI reply to the terminal as it streams in"""
+    say("\n🤖 HealthBot AI: ")
+    streamed = []
+    
+    def show(text):
+        streamed.append(text)
+        say(text)
+    
+    response = await get_ai_manager().generate_response(user_message, session_id, on_chunk=show)
+    # Error fallbacks are returned without streaming, so print them whole
+    say(("" if streamed else response) + "\n\n")
+    return response
+
+# Directory listings for the terminal commands, cached with the same TTL/version policy as the AI context
+DIRECTORY_SQL = {
+    "services": """
+        SELECT s.name, s.department, s.price, c.name as clinic_name
+        FROM services s JOIN clinics c ON s.clinic_id = c.id
+        ORDER BY s.department, s.name
+    """,
+    "doctors": """
+        SELECT d.name, d.specialty, d.working_hours_display, c.name as clinic_name
+        FROM doctors d JOIN clinics c ON d.clinic_id = c.id
+        ORDER BY d.specialty, d.name
+    """,
+    "clinics": "SELECT name, address, phone, operating_hours FROM clinics ORDER BY name",
+}
+directory_cache = {}
+
+async def load_directory(name: str):
+    """Return a directory listing, re-querying only when stale or after a write"""
+    cached = directory_cache.get(name)
+    if cached and cached[0] == SCHEMA_VERSION and time.monotonic() - cached[1] < CONTEXT_CACHE_TTL:
+        return cached[2]
+    rows = await db_manager.execute_async(DIRECTORY_SQL[name])
+    directory_cache[name] = (SCHEMA_VERSION, time.monotonic(), rows)
+    return rows
+
+def render_services(services: list) -> str:
+    """Format the whole service directory, grouped by department, as one block of text"""
+    lines = ["\n🩺 AVAILABLE SERVICES:"]
+    current_dept = ""
+    for service in services:
+        if service['department'] != current_dept:
+            current_dept = service['department']
+            lines.append(f"\n📍 {current_dept}:")
+        lines.append(f"  • {service['name']} - ₹{service['price']} at {service['clinic_name']}")
+    return "\n".join(lines) + "\n\n"
+
+def render_doctors(doctors: list) -> str:
+    """Format the whole doctor directory as one block of text"""
+    lines = ["\n👩‍⚕️ AVAILABLE DOCTORS:"]
+    for doctor in doctors:
+        lines.append(f"  • Dr. {doctor['name']} - {doctor['specialty']}")
+        lines.append(f"    Hours: {doctor['working_hours_display']} at {doctor['clinic_name']}")
+    return "\n".join(lines) + "\n\n"
+
+def render_clinics(clinics: list) -> str:
+    """Format the whole clinic directory as one block of text"""
+    return "\n🏥 OUR CLINICS:\n" + "".join(
+        f"  • {clinic['name']}\n"
+        f"    📍 {clinic['address']}\n"
+        f"    📞 {clinic['phone']} | ⏰ {clinic['operating_hours']}\n\n"
+        for clinic in clinics
+    )
+
+# Fully formatted listings, built once and reused until the directory rows change
+listing_cache = {}
+
+async def load_listing(name: str, render) -> str:
+    """Return a formatted directory listing, re-rendering only when its rows were reloaded"""
+    rows = await load_directory(name)
+    cached = listing_cache.get(name)
+    if cached and cached[0] is rows:
+        return cached[1]
+    text = render(rows)
+    listing_cache[name] = (rows, text)
+    return text
+
+LISTING_RENDERERS = {
+    "services": render_services,
+    "doctors": render_doctors,
+    "clinics": render_clinics,
+}
+
+async def prewarm_listings():
+    """Build every formatted listing up front so the first listing command is a single cached write"""
+    await asyncio.gather(*(load_listing(name, render) for name, render in LISTING_RENDERERS.items()))
+
+HELP_TEXT = (
+    "\n📋 AVAILABLE COMMANDS:\n"
+    "• 'services' - View all available healthcare services\n"
+    "• 'doctors' - View all available doctors\n"
+    "• 'clinics' - View all clinic locations\n"
+    "• 'reset' - Start a new conversation\n"
+    "• 'quit/exit/bye' - End conversation\n"
+    "• Just type naturally to book appointments or ask health questions!\n\n"
+)
+
+async def show_help(session_id: str) -> str:
+    """Print the terminal commands"""
+    say(HELP_TEXT)
+    return session_id
+
+async def reset_conversation(session_id: str) -> str:
+    """Drop the current session and start a new one"""
+    get_ai_manager().reset_session(session_id)
+    say("\n🔄 Conversation reset! Starting fresh...\n\n")
+    return f"terminal_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+async def show_services(session_id: str) -> str:
+    """Print services grouped by department"""
+    say(await load_listing("services", render_services))
+    return session_id
+
+async def show_doctors(session_id: str) -> str:
+    """Print doctors with their hours and clinic"""
+    say(await load_listing("doctors", render_doctors))
+    return session_id
+
+async def show_clinics(session_id: str) -> str:
+    """Print clinic addresses and contact details"""
+    say(await load_listing("clinics", render_clinics))
+    return session_id
+
+# Terminal commands: each handler takes the session id and returns the (possibly new) one
+QUIT_COMMANDS = {"quit", "exit", "bye"}
+TERMINAL_COMMANDS = {
+    "help": show_help,
+    "reset": reset_conversation,
+    "services": show_services,
+    "doctors": show_doctors,
+    "clinics": show_clinics,
+}
+
+CHAT_BANNER = (
+    "\n" + "="*60 + "\n"
+    "🏥 HEALTHBOT AI - Healthcare Appointment Assistant\n"
+    + "="*60 + "\n"
+    "💡 Type 'quit', 'exit', or 'bye' to end the conversation\n"
+    "💡 Type 'help' for available commands\n"
+    "💡 Type 'reset' to start a new conversation\n"
+    + "-"*60 + "\n"
+)
+
 async def main_chat_loop():
     """Main chat loop for terminal interaction"""
-    print("\n" + "="*60)
-    print("🏥 HEALTHBOT AI - Healthcare Appointment Assistant")
-    print("="*60)
-    print("💡 Type 'quit', 'exit', or 'bye' to end the conversation")
-    print("💡 Type 'help' for available commands")
-    print("💡 Type 'reset' to start a new conversation")
-    print("-"*60)
+    say(CHAT_BANNER)
     
     session_id = f"terminal_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
     # Welcome message
-    welcome_response = await ai_manager.generate_response(
+    await print_streamed_response(
         "Hello! Please provide a warm welcome message and ask how you can help with healthcare needs today.",
         session_id
     )
-    print(f"\n🤖 HealthBot AI: {welcome_response}\n")
     
+    prewarm_task = None
     while True:
         try:
-            user_input = input("👤 You: ").strip()
+            user_input = (await read_user_input("👤 You: ")).strip()
             
-            if user_input.lower() in ['quit', 'exit', 'bye']:
-                print("\n🤖 HealthBot AI: Thank you for using our healthcare service. Take care and stay healthy! 👋")
+            command = user_input.lower()
+            if command in QUIT_COMMANDS:
+                say("\n🤖 HealthBot AI: Thank you for using our healthcare service. Take care and stay healthy! 👋\n")
                 break
             
-            if user_input.lower() == 'help':
-                print("\n📋 AVAILABLE COMMANDS:")
-                print("• 'services' - View all available healthcare services")
-                print("• 'doctors' - View all available doctors")
-                print("• 'clinics' - View all clinic locations")
-                print("• 'reset' - Start a new conversation")
-                print("• 'quit/exit/bye' - End conversation")
-                print("• Just type naturally to book appointments or ask health questions!\n")
-                continue
-            
-            if user_input.lower() == 'reset':
-                session_id = f"terminal_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                ai_manager.conversation_history[session_id] = []
-                print("\n🔄 Conversation reset! Starting fresh...\n")
-                continue
-            
-            if user_input.lower() == 'services':
-                services = db_manager.execute_dynamic_query("""
-                    SELECT s.name, s.department, s.price, c.name as clinic_name
-                    FROM services s JOIN clinics c ON s.clinic_id = c.id
-                    ORDER BY s.department, s.name
-                """)
-                print("\n🩺 AVAILABLE SERVICES:")
-                current_dept = ""
-                for service in services:
-                    if service['department'] != current_dept:
-                        current_dept = service['department']
-                        print(f"\n📍 {current_dept}:")
-                    print(f"  • {service['name']} - ₹{service['price']} at {service['clinic_name']}")
-                print()
-                continue
-            
-            if user_input.lower() == 'doctors':
-                doctors = db_manager.execute_dynamic_query("""
-                    SELECT d.name, d.specialty, d.working_hours_display, c.name as clinic_name
-                    FROM doctors d JOIN clinics c ON d.clinic_id = c.id
-                    ORDER BY d.specialty, d.name
-                """)
-                print("\n👩‍⚕️ AVAILABLE DOCTORS:")
-                for doctor in doctors:
-                    print(f"  • Dr. {doctor['name']} - {doctor['specialty']}")
-                    print(f"    Hours: {doctor['working_hours_display']} at {doctor['clinic_name']}")
-                print()
-                continue
-            
-            if user_input.lower() == 'clinics':
-                clinics = db_manager.execute_dynamic_query("""
-                    SELECT name, address, phone, operating_hours FROM clinics ORDER BY name
-                """)
-                print("\n🏥 OUR CLINICS:")
-                for clinic in clinics:
-                    print(f"  • {clinic['name']}")
-                    print(f"    📍 {clinic['address']}")
-                    print(f"    📞 {clinic['phone']} | ⏰ {clinic['operating_hours']}")
-                    print()
+            handler = TERMINAL_COMMANDS.get(command)
+            if handler:
+                session_id = await handler(session_id)
                 continue
             
             if not user_input:
                 continue
             
             # Process with AI
-            print("\n🤔 Processing your request...")
-            response = await ai_manager.generate_response(user_input, session_id)
-            print(f"\n🤖 HealthBot AI: {response}\n")
+            say("\n🤔 Processing your request...\n")
+            await print_streamed_response(user_input, session_id)
             
-        except KeyboardInterrupt:
-            print("\n\n👋 Goodbye! Stay healthy!")
+            # Refresh the AI context while the user is typing the next message
+            prewarm_task = asyncio.create_task(get_ai_manager().prewarm_context())
+            
+        except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
+            # Ctrl+C reaches the loop as a cancellation now that input() runs off the event loop
+            say("\n\n👋 Goodbye! Stay healthy!\n")
             break
         except Exception as e:
-            logger.exception(f"Error in main chat loop: {e}")
-            print(f"\n❌ Sorry, I encountered an error: {str(e)}")
-            print("Please try again or contact our clinic directly.\n")
+            logger.exception("Error in main chat loop: %s", e)
+            say(f"\n❌ Sorry, I encountered an error: {str(e)}\n"
+                "Please try again or contact our clinic directly.\n\n")
 
 # ------------------------------------------------------------------------------
 # Server Startup
 # ------------------------------------------------------------------------------
+async def check_systems():
+    """Run the database and Gemini startup checks concurrently and report their status"""
+    # Test database connections; all three counts come back in one round trip
+    checks = [db_manager.execute_async(TABLE_COUNTS_SQL, as_dicts=False)]
+    
+    # Load the Gemini SDK while the counts run; connectivity is verified by the first real chat turn
+    checks.append(asyncio.to_thread(get_ai_manager))
+    
+    # Render the directory listings in the same pass
+    checks.append(prewarm_listings())
+    
+    count_rows, ai_manager, _ = await asyncio.gather(*checks)
+    counts = dict(count_rows)
+    if not callable(getattr(ai_manager.model, 'generate_content', None)):
+        say("   ❌ Gemini AI: Model could not be initialized\n")
+        raise RuntimeError("Gemini model has no callable generate_content; check the google-generativeai installation")
+    
+    gemini_status = "   ✅ Gemini AI: Configured (connection checked on first message)\n"
+    say("\n🏥 Database Status:\n"
+        f"   ✅ Services: {counts['services']} available\n"
+        f"   ✅ Doctors: {counts['doctors']} available\n"
+        f"   ✅ Clinics: {counts['clinics']} locations\n"
+        + gemini_status)
+
+async def start_terminal_chat():
+    """Check all systems, then run the chat loop on the same event loop"""
+    await check_systems()
+    
+    say("\n🚀 All systems ready! Starting chat interface...\n" + "="*60 + "\n")
+    
+    # Start the interactive chat interface
+    await main_chat_loop()
+
 if __name__ == "__main__":
+    # Terminal output is written in whole blocks and flushed explicitly by say()
+    sys.stdout.reconfigure(line_buffering=False, write_through=False)
     logger.info("🚀 Starting Healthcare Gemini AI MCP Server...")
     
     # Check if Gemini API key is configured
     if GEMINI_API_KEY == "your-gemini-api-key-here" or not GEMINI_API_KEY:
-        print("\n⚠️  WARNING: Please set your GEMINI_API_KEY!")
-        print("🔧 Option 1: Set environment variable - export GEMINI_API_KEY='your-actual-key'")
-        print("🔧 Option 2: Edit the GEMINI_API_KEY variable in this file")
-        print("🔗 Get your API key from: https://makersuite.google.com/app/apikey")
+        say("\n⚠️  WARNING: Please set your GEMINI_API_KEY!\n"
+            "🔧 Option 1: Set environment variable - export GEMINI_API_KEY='your-actual-key'\n"
+            "🔧 Option 2: Edit the GEMINI_API_KEY variable in this file\n"
+            "🔗 Get your API key from: https://makersuite.google.com/app/apikey\n")
         
         # Ask user if they want to input API key now
         api_key_input = input("\n💡 Enter your Gemini API key now (or press Enter to exit): ").strip()
         if api_key_input:
-            genai.configure(api_key=api_key_input)
+            # Picked up by load_genai() when the SDK is first loaded
             GEMINI_API_KEY = api_key_input
-            print("✅ API key configured!")
+            say("✅ API key configured!\n")
         else:
-            print("❌ Cannot proceed without API key. Exiting...")
+            say("❌ Cannot proceed without API key. Exiting...\n")
             sys.exit(1)
     
-    # Verify database files exist
-    if not os.path.exists(SERVICES_DB_PATH):
-        print(f"\n❌ Database file not found: {SERVICES_DB_PATH}")
-        print("🔧 Please run: python healthcare_db_setup.py")
+    # Verify database files existed before the connection pools were opened
+    if MISSING_DATABASE_FILES:
+        say(f"\n❌ Database file not found: {MISSING_DATABASE_FILES[0]}\n"
+            "🔧 Please run: python healthcare_db_setup.py\n")
         sys.exit(1)
     
-    if not os.path.exists(APPOINTMENTS_DB_PATH):
-        print(f"\n❌ Database file not found: {APPOINTMENTS_DB_PATH}")
-        print("🔧 Please run: python healthcare_db_setup.py")
-        sys.exit(1)
+    # Use the libuv event loop where available (not on Windows)
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     
     try:
-        # Test database connections
-        test_services = db_manager.execute_dynamic_query("SELECT COUNT(*) as count FROM services")
-        test_doctors = db_manager.execute_dynamic_query("SELECT COUNT(*) as count FROM doctors")
-        test_clinics = db_manager.execute_dynamic_query("SELECT COUNT(*) as count FROM clinics")
-        
-        print("\n🏥 Database Status:")
-        print(f"   ✅ Services: {test_services[0]['count']} available")
-        print(f"   ✅ Doctors: {test_doctors[0]['count']} available") 
-        print(f"   ✅ Clinics: {test_clinics[0]['count']} locations")
-        
-        # Test Gemini AI connection
-        test_response = ai_manager.model.generate_content("Hello! Just testing the connection.")
-        print("   ✅ Gemini AI: Connected and responsive")
-        
-        print("\n🚀 All systems ready! Starting chat interface...")
-        print("="*60)
-        
-        # Start the interactive chat interface
-        asyncio.run(main_chat_loop())
+        # Startup checks and the interactive chat interface share one event loop
+        asyncio.run(start_terminal_chat())
         
     except Exception as e:
-        logger.exception(f"Server startup failed: {e}")
-        print(f"\n❌ Startup Error: {str(e)}")
-        print("\n🔧 Troubleshooting:")
-        print("1. Check if databases are properly created")
-        print("2. Verify Gemini API key is valid")
-        print("3. Ensure all dependencies are installed")
-        print("4. Check network connection")
+        logger.exception("Server startup failed: %s", e)
+        say(f"\n❌ Startup Error: {str(e)}\n"
+            "\n🔧 Troubleshooting:\n"
+            "1. Check if databases are properly created\n"
+            "2. Verify Gemini API key is valid\n"
+            "3. Ensure all dependencies are installed\n"
+            "4. Check network connection\n")
         
     finally:
-        # Clean shutdown
-        try:
-            if 'db_manager' in globals():
-                db_manager.services_conn.close()
-                db_manager.appointments_conn.close()
-                logger.info("Database connections closed successfully.")
-        except Exception as e:
-            logger.warning(f"Error closing database connections: {e}")
-        
+        # Database connections are closed by the atexit hook registered with db_manager
         logger.info("🏥 Healthcare Gemini AI MCP Server shutdown complete.")
-        print("\n👋 Thank you for using Healthcare AI Assistant!")
-        print("💚 Stay healthy and take care!")
\ No newline at end of file
+        say("\n👋 Thank you for using Healthcare AI Assistant!\n"
+            "💚 Stay healthy and take care!\n")
\ No newline at end of file
@@ -19,14 +19,25 @@ import logging
 import sys
 import os
 import asyncio
-from datetime import datetime, timedelta
+import queue
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from datetime import datetime
 from typing import Dict, List, Any, Optional
+import orjson
 import google.generativeai as genai
 import dotenv
 dotenv.load_dotenv()
 
 # Import MCP components
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Context
 from mcp.server.fastmcp.prompts.base import UserMessage, Message
 
 # ------------------------------------------------------------------------------
@@ -40,6 +51,134 @@ genai.configure(api_key=GEMINI_API_KEY)
 SERVICES_DB_PATH = "healthcare_services.db"
 APPOINTMENTS_DB_PATH = "appointments.db"
 
+# WAL with NORMAL sync avoids an fsync per interaction-log insert; the page cache and mmap
+# keep hot tables in memory, and busy_timeout lets a reader wait out a concurrent write
+SQLITE_CONNECTION_PRAGMAS = (
+    'temp_store=MEMORY',
+    'foreign_keys=ON',
+    'busy_timeout=5000',
+)
+# These are per database file, so they are applied to main and to every ATTACHed database
+SQLITE_DATABASE_PRAGMAS = (
+    'journal_mode=WAL',
+    'synchronous=NORMAL',
+    'cache_size=-65536',
+    'mmap_size=268435456',
+)
+
+# Read-only connections kept open per database; each database also gets one writer connection
+# so writes are serialized while reads run in parallel from worker threads
+DB_READER_POOL_SIZE = 4
+
+# Prepared statements kept per connection, so repeated tool queries skip re-parsing
+SQLITE_CACHED_STATEMENTS = 256
+
+# Indexes for the recent-appointments, doctor-day, patient and session lookups
+ENHANCED_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS idx_apt_created ON enhanced_appointments (created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_apt_patient_phone ON enhanced_appointments (patient_phone)",
+    "CREATE INDEX IF NOT EXISTS idx_apt_doctor_date ON enhanced_appointments (doctor_id, appointment_date)",
+    "CREATE INDEX IF NOT EXISTS idx_log_session ON enhanced_interaction_logs (session_id, timestamp DESC)",
+)
+# Service search uses db_setup.py's trigram index when present; trigrams need queries of this length
+SERVICES_SEARCH_MIN_LENGTH = 3
+
+# Keywords for intent detection, in priority order: the first intent with a match wins
+INTENT_KEYWORDS = {
+    'book_appointment': ('book', 'appointment', 'schedule'),
+    'symptom_inquiry': ('pain', 'hurt', 'ache', 'sick'),
+    'doctor_inquiry': ('doctor', 'specialist'),
+    'pricing_inquiry': ('cost', 'price', 'fee'),
+}
+PAIN_LEVEL_PATTERN = re.compile(r'(\d+)\s*(?:out of|/)\s*10|pain.*?(\d+)')
+TIME_WORDS = ('today', 'tomorrow', 'morning', 'evening', 'afternoon')
+
+# Every intent keyword and time word in one compiled alternation, so a message is scanned once per turn
+KEYWORD_KINDS = {word: intent for intent, words in INTENT_KEYWORDS.items() for word in words}
+KEYWORD_KINDS.update((word, 'time') for word in TIME_WORDS)
+KEYWORD_PATTERN = re.compile("|".join(sorted(map(re.escape, KEYWORD_KINDS), key=len, reverse=True)))
+# Section headers in the Gemini insights reply; the questions section runs to the end of the text
+INSIGHT_SECTION_PATTERN = re.compile(r'(FOCUS AREAS|PRELIMINARY|QUESTIONS)[^:\n]*:[ \t]*([^\n]*)', re.IGNORECASE)
+
+# Each session keeps its last HISTORY_MAX_MESSAGES lines; the chat prompt uses the newest
+# PROMPT_HISTORY_MESSAGES of them, and sessions idle for SESSION_IDLE_TIMEOUT seconds are dropped
+HISTORY_MAX_MESSAGES = 20
+PROMPT_HISTORY_MESSAGES = 10
+SESSION_IDLE_TIMEOUT = 3600
+# Booking mood and interaction-quality labels indexed by the length of the session history
+PATIENT_MOOD_BY_LENGTH = tuple("cooperative" if n > 4 else "brief" for n in range(HISTORY_MAX_MESSAGES + 1))
+INTERACTION_QUALITY_BY_LENGTH = tuple("excellent" if n > 10 else "good" for n in range(HISTORY_MAX_MESSAGES + 1))
+
+# Streamed Gemini calls block while reading, so they run on a dedicated, bounded thread pool
+# sized for network concurrency instead of the loop's default executor
+GEMINI_MAX_WORKERS = 16
+
+# At most this many Gemini requests (completions and streams) are in flight at once,
+# so bursts queue locally instead of hitting the API's rate limit and retrying
+GEMINI_MAX_CONCURRENT_REQUESTS = 5
+
+# Interaction logs are queued and written in batches by a background task, at most
+# LOG_FLUSH_INTERVAL seconds after the first queued row or as soon as a full batch is waiting
+LOG_FLUSH_INTERVAL = 1.0
+LOG_BATCH_SIZE = 50
+
+# Written on every chat turn, so kept as one constant SQL text that stays in the statement cache
+INTERACTION_LOG_INSERT_SQL = """
+    INSERT INTO enhanced_interaction_logs 
+    (session_id, user_input, ai_response, conversation_step, intent_detected, 
+     entities_extracted, confidence_score, timestamp, processing_time_ms)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Terminal listing queries, kept as constant SQL texts shared by the statement and listing caches
+LIST_SERVICES_SQL = """
+    SELECT s.name, s.department, s.price, c.name as clinic_name
+    FROM services s JOIN clinics c ON s.clinic_id = c.id
+    ORDER BY s.department, s.name
+"""
+LIST_DOCTORS_SQL = """
+    SELECT d.name, d.specialty, d.working_hours_display, c.name as clinic_name
+    FROM doctors d JOIN clinics c ON d.clinic_id = c.id
+    ORDER BY d.specialty, d.name
+"""
+LIST_CLINICS_SQL = """
+    SELECT name, address, phone, operating_hours FROM clinics ORDER BY name
+"""
+
+# Seconds the built AI system context is reused before it is rebuilt from the database
+CONTEXT_CACHE_TTL = 1800
+
+# Bumped whenever clinics, doctors or services change so the cached AI context is rebuilt
+CONTEXT_VERSION = 0
+CONTEXT_TABLES = ("clinics", "doctors", "services")
+
+# Seconds the services/doctors/clinics lists sent with each chat message are reused
+DIRECTORY_CACHE_TTL = 60
+
+# Replies to repeated, non-personalized messages are reused for this many seconds
+RESPONSE_CACHE_TTL = 600
+RESPONSE_CACHE_MAX_ENTRIES = 2048
+
+# Weekday names accepted by get_real_time_availability, numbered like time_slots.day_of_week
+DAY_NUMBERS = {"monday": 1, "tuesday": 2, "wednesday": 3, "thursday": 4, "friday": 5, "saturday": 6, "sunday": 7}
+
+# Availability SQL for every (doctor, service, day) filter combination, built once at import;
+# the service filter is a semi-join, so each slot appears once without a DISTINCT sort
+AVAILABILITY_QUERIES = {
+    (by_doctor, by_service, by_day): f"""
+        SELECT ts.*, d.name as doctor_name, d.specialty, c.name as clinic_name
+        FROM time_slots ts
+        JOIN doctors d ON ts.doctor_id = d.id
+        JOIN clinics c ON d.clinic_id = c.id
+        WHERE ts.is_available = 1
+        {"AND ts.doctor_id = ?" if by_doctor else ""}
+        {"AND EXISTS (SELECT 1 FROM doctor_services ds WHERE ds.doctor_id = ts.doctor_id AND ds.service_id = ?)" if by_service else ""}
+        {"AND ts.day_of_week = ?" if by_day else ""}
+        ORDER BY ts.day_of_week, ts.start_time
+    """
+    for by_doctor in (False, True) for by_service in (False, True) for by_day in (False, True)
+}
+
 # ------------------------------------------------------------------------------
 # Logging Setup
 # ------------------------------------------------------------------------------
@@ -57,188 +196,359 @@ logger = logging.getLogger("healthcare_gemini_mcp")
 # ------------------------------------------------------------------------------
 # Enhanced Database Manager Class
 # ------------------------------------------------------------------------------
+def row_to_dict(row):
+    """JSON default hook that converts one sqlite3.Row at a time while encoding"""
+    if isinstance(row, sqlite3.Row):
+        return {key: row[key] for key in row.keys()}
+    raise TypeError(f"Object of type {type(row).__name__} is not JSON serializable")
+
+@lru_cache(maxsize=SQLITE_CACHED_STATEMENTS)
+def statement_kind(query: str) -> str:
+    """Leading SQL keyword of a statement, memoized so repeated queries are not re-scanned"""
+    return query.lstrip().split(None, 1)[0].upper()
+
+def add_minutes(clock: str, minutes: int) -> str:
+    """Add minutes to an HH:MM:SS time with integer arithmetic, wrapping past midnight"""
+    hours, mins, secs = map(int, clock.split(':'))
+    total = (hours * 3600 + mins * 60 + secs + minutes * 60) % 86400
+    return f"{total // 3600:02d}:{total % 3600 // 60:02d}:{total % 60:02d}"
+
+def loads(payload):
+    """Parse a JSON tool argument with orjson; already-decoded objects pass through"""
+    return orjson.loads(payload) if isinstance(payload, (bytes, str)) else payload
+
+def dumps(obj) -> str:
+    """Serialize resource and tool payloads compactly with orjson"""
+    return orjson.dumps(obj, default=row_to_dict, option=orjson.OPT_NON_STR_KEYS).decode()
+
 class DatabaseManager:
     def __init__(self):
-        self.services_conn = None
-        self.appointments_conn = None
+        self.pools = {}
+        self._schema_cache = None
+        self._schema_lock = threading.Lock()
+        self._listing_cache = {}
+        # Bumped after every committed appointments write other than interaction logs
+        self.appointments_version = 0
         self.connect_databases()
         self.ensure_enhanced_schema()
     
+    def open_connection(self, path: str, read_only: bool, attach: str = None):
+        """Open one pooled connection with proper configuration"""
+        # Readers open the file read-only at the OS level; query_only below also guards the SQL layer.
+        # Writers use mode=rw so a missing database fails here instead of being created empty
+        target = f"file:{path}?mode={'ro' if read_only else 'rw'}"
+        conn = sqlite3.connect(target, uri=True, check_same_thread=False, cached_statements=SQLITE_CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        if attach:
+            # Bookings write time_slots and the appointment tables in one transaction through this schema
+            conn.execute("ATTACH DATABASE ? AS services", (attach,))
+        for pragma in SQLITE_CONNECTION_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma}")
+        for schema in ("main", "services") if attach else ("main",):
+            for pragma in SQLITE_DATABASE_PRAGMAS:
+                conn.execute(f"PRAGMA {schema}.{pragma}")
+        conn.execute(f"PRAGMA query_only={int(read_only)}")
+        return conn
+    
     def connect_databases(self):
-        """Connect to both databases with proper configuration"""
+        """Open a reader pool and a single writer connection for each database"""
         try:
-            self.services_conn = sqlite3.connect(SERVICES_DB_PATH, check_same_thread=False)
-            self.services_conn.row_factory = sqlite3.Row
+            for db, path, attach in (("services", SERVICES_DB_PATH, None),
+                                     ("appointments", APPOINTMENTS_DB_PATH, SERVICES_DB_PATH)):
+                # The writer is opened first so it can switch the file to WAL before readers attach
+                writer = queue.Queue(maxsize=1)
+                writer.put(self.open_connection(path, read_only=False, attach=attach))
+                readers = queue.Queue(maxsize=DB_READER_POOL_SIZE)
+                for _ in range(DB_READER_POOL_SIZE):
+                    readers.put(self.open_connection(path, read_only=True))
+                self.pools[(db, True)] = writer
+                self.pools[(db, False)] = readers
             
-            self.appointments_conn = sqlite3.connect(APPOINTMENTS_DB_PATH, check_same_thread=False)
-            self.appointments_conn.row_factory = sqlite3.Row
-            
-            logger.info(f"Connected to databases: {SERVICES_DB_PATH} and {APPOINTMENTS_DB_PATH}")
+            logger.info(f"Connected to databases: {SERVICES_DB_PATH} and {APPOINTMENTS_DB_PATH} ({DB_READER_POOL_SIZE} readers + 1 writer each)")
         except Exception as e:
             logger.exception(f"Failed to connect to databases: {e}")
             raise
     
+    @contextmanager
+    def connection(self, db: str = "services", write: bool = False):
+        """Borrow a pooled connection, returning it to the pool afterwards"""
+        pool = self.pools[(db, write)]
+        conn = pool.get()
+        try:
+            yield conn
+        finally:
+            pool.put(conn)
+    
+    def close(self):
+        """Close every pooled connection, letting the writers refresh query planner statistics and truncate the WAL first"""
+        for (db, write), pool in self.pools.items():
+            while not pool.empty():
+                conn = pool.get_nowait()
+                if write:
+                    try:
+                        # Readers are read-only, so only the writers can store the ANALYZE results
+                        conn.execute("PRAGMA optimize")
+                        # Another process (e.g. the MCP server) may still have the database open, in which
+                        # case closing here would not checkpoint and the WAL file would stay at its full size
+                        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    except sqlite3.Error as e:
+                        logger.warning(f"Shutdown maintenance failed for {db} database: {e}")
+                conn.close()
+    
     def ensure_enhanced_schema(self):
         """Ensure the appointments database has all required tables with enhanced schema"""
         try:
-            # Enhanced appointments table with comprehensive data storage
-            self.appointments_conn.execute("""
-                CREATE TABLE IF NOT EXISTS enhanced_appointments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    appointment_number TEXT UNIQUE NOT NULL,
-                    
-                    -- Patient Information
-                    patient_id INTEGER,
-                    patient_name TEXT NOT NULL,
-                    patient_phone TEXT,
-                    patient_email TEXT,
-                    patient_age INTEGER,
-                    patient_gender TEXT,
-                    patient_address TEXT,
-                    patient_medical_history TEXT,
-                    patient_emergency_contact TEXT,
-                    
-                    -- Doctor Information
-                    doctor_id INTEGER NOT NULL,
-                    doctor_name TEXT NOT NULL,
-                    doctor_specialty TEXT NOT NULL,
-                    doctor_phone TEXT,
-                    doctor_qualifications TEXT,
-                    
-                    -- Clinic Information
-                    clinic_id INTEGER NOT NULL,
-                    clinic_name TEXT NOT NULL,
-                    clinic_address TEXT NOT NULL,
-                    clinic_phone TEXT,
-                    clinic_operating_hours TEXT,
-                    
-                    -- Service Information
-                    service_id INTEGER,
-                    service_name TEXT NOT NULL,
-                    service_description TEXT,
-                    service_department TEXT,
-                    service_price DECIMAL(10,2),
-                    service_duration_minutes INTEGER,
-                    
-                    -- Appointment Details
-                    appointment_date DATE NOT NULL,
-                    appointment_time TIME NOT NULL,
-                    appointment_end_time TIME,
-                    slot_id INTEGER,
-                    
-                    -- Patient Complaint & Symptoms
-                    patient_complaint TEXT,
-                    symptoms_description TEXT,
-                    symptoms_duration TEXT,
-                    pain_level INTEGER CHECK(pain_level >= 0 AND pain_level <= 10),
-                    urgency_level TEXT DEFAULT 'normal',
-                    
-                    -- AI Generated Summary (200 words for doctor)
-                    ai_patient_summary TEXT,
-                    ai_recommended_focus_areas TEXT,
-                    ai_preliminary_assessment TEXT,
-                    ai_suggested_questions TEXT,
-                    
-                    -- Appointment Management
-                    status TEXT DEFAULT 'scheduled',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    booking_source TEXT DEFAULT 'ai_assistant',
-                    special_instructions TEXT,
-                    follow_up_required BOOLEAN DEFAULT 0,
-                    
-                    -- Communication Log
-                    conversation_summary TEXT,
-                    patient_mood_assessment TEXT,
-                    booking_interaction_quality TEXT
-                )
-            """)
-            
-            # Appointment status history
-            self.appointments_conn.execute("""
-                CREATE TABLE IF NOT EXISTS appointment_status_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    appointment_id INTEGER REFERENCES enhanced_appointments(id),
-                    old_status TEXT,
-                    new_status TEXT,
-                    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    changed_by TEXT,
-                    reason TEXT
-                )
-            """)
-            
-            # Enhanced interaction logs
-            self.appointments_conn.execute("""
-                CREATE TABLE IF NOT EXISTS enhanced_interaction_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    appointment_id INTEGER REFERENCES enhanced_appointments(id),
-                    user_input TEXT NOT NULL,
-                    ai_response TEXT NOT NULL,
-                    conversation_step TEXT,
-                    intent_detected TEXT,
-                    entities_extracted TEXT,
-                    confidence_score REAL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    processing_time_ms INTEGER
-                )
-            """)
-            
-            self.appointments_conn.commit()
+            with self.connection("appointments", write=True) as conn:
+                # sqlite3 does not open a transaction for DDL by itself, so begin one explicitly
+                # and create every table and index under the single commit below
+                conn.execute("BEGIN")
+                
+                # Enhanced appointments table with comprehensive data storage
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS enhanced_appointments (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        appointment_number TEXT UNIQUE NOT NULL,
+                        
+                        -- Patient Information
+                        patient_id INTEGER,
+                        patient_name TEXT NOT NULL,
+                        patient_phone TEXT,
+                        patient_email TEXT,
+                        patient_age INTEGER,
+                        patient_gender TEXT,
+                        patient_address TEXT,
+                        patient_medical_history TEXT,
+                        patient_emergency_contact TEXT,
+                        
+                        -- Doctor Information
+                        doctor_id INTEGER NOT NULL,
+                        doctor_name TEXT NOT NULL,
+                        doctor_specialty TEXT NOT NULL,
+                        doctor_phone TEXT,
+                        doctor_qualifications TEXT,
+                        
+                        -- Clinic Information
+                        clinic_id INTEGER NOT NULL,
+                        clinic_name TEXT NOT NULL,
+                        clinic_address TEXT NOT NULL,
+                        clinic_phone TEXT,
+                        clinic_operating_hours TEXT,
+                        
+                        -- Service Information
+                        service_id INTEGER,
+                        service_name TEXT NOT NULL,
+                        service_description TEXT,
+                        service_department TEXT,
+                        service_price DECIMAL(10,2),
+                        service_duration_minutes INTEGER,
+                        
+                        -- Appointment Details
+                        appointment_date DATE NOT NULL,
+                        appointment_time TIME NOT NULL,
+                        appointment_end_time TIME,
+                        slot_id INTEGER,
+                        
+                        -- Patient Complaint & Symptoms
+                        patient_complaint TEXT,
+                        symptoms_description TEXT,
+                        symptoms_duration TEXT,
+                        pain_level INTEGER CHECK(pain_level >= 0 AND pain_level <= 10),
+                        urgency_level TEXT DEFAULT 'normal',
+                        
+                        -- AI Generated Summary (200 words for doctor)
+                        ai_patient_summary TEXT,
+                        ai_recommended_focus_areas TEXT,
+                        ai_preliminary_assessment TEXT,
+                        ai_suggested_questions TEXT,
+                        
+                        -- Appointment Management
+                        status TEXT DEFAULT 'scheduled',
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        booking_source TEXT DEFAULT 'ai_assistant',
+                        special_instructions TEXT,
+                        follow_up_required BOOLEAN DEFAULT 0,
+                        
+                        -- Communication Log
+                        conversation_summary TEXT,
+                        patient_mood_assessment TEXT,
+                        booking_interaction_quality TEXT
+                    )
+                """)
+                
+                # Appointment status history
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS appointment_status_history (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        appointment_id INTEGER REFERENCES enhanced_appointments(id),
+                        old_status TEXT,
+                        new_status TEXT,
+                        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        changed_by TEXT,
+                        reason TEXT
+                    )
+                """)
+                
+                # Enhanced interaction logs
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS enhanced_interaction_logs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        session_id TEXT NOT NULL,
+                        appointment_id INTEGER REFERENCES enhanced_appointments(id),
+                        user_input TEXT NOT NULL,
+                        ai_response TEXT NOT NULL,
+                        conversation_step TEXT,
+                        intent_detected TEXT,
+                        entities_extracted TEXT,
+                        confidence_score REAL,
+                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        processing_time_ms INTEGER
+                    )
+                """)
+                
+                for statement in ENHANCED_INDEX_SQL:
+                    conn.execute(statement)
+                
+                conn.commit()
+            # The services database indexes are all created by db_setup.py
+            self.invalidate_schema()
             logger.info("Enhanced database schema ensured successfully")
             
         except Exception as e:
             logger.exception(f"Error ensuring enhanced schema: {e}")
             raise
     
+    def invalidate_schema(self):
+        """Drop the cached schema; call after any DDL"""
+        with self._schema_lock:
+            self._schema_cache = None
+    
     def get_database_schema(self):
-        """Dynamically get database schema for AI context"""
-        try:
-            schema_info = {
-                "services_db": {},
-                "appointments_db": {}
-            }
-            
-            # Get services database schema
-            cursor = self.services_conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            for table_name in cursor.fetchall():
-                table = table_name[0]
-                cursor = self.services_conn.execute(f"PRAGMA table_info({table})")
-                schema_info["services_db"][table] = [dict(row) for row in cursor.fetchall()]
-            
-            # Get appointments database schema
-            cursor = self.appointments_conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            for table_name in cursor.fetchall():
-                table = table_name[0]
-                cursor = self.appointments_conn.execute(f"PRAGMA table_info({table})")
-                schema_info["appointments_db"][table] = [dict(row) for row in cursor.fetchall()]
-            
+        """Dynamically get database schema for AI context, cached until the next DDL"""
+        schema_info = self._schema_cache
+        if schema_info is not None:
             return schema_info
-        except Exception as e:
-            logger.exception(f"Error getting database schema: {e}")
-            return {}
+        with self._schema_lock:
+            if self._schema_cache is not None:
+                return self._schema_cache
+            try:
+                schema_info = {
+                    "services_db": {},
+                    "appointments_db": {}
+                }
+                
+                # Get services and appointments database schema
+                for db in ("services", "appointments"):
+                    with self.connection(db) as conn:
+                        cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+                        for table_name in cursor.fetchall():
+                            table = table_name[0]
+                            cursor = conn.execute(f"PRAGMA table_info({table})")
+                            schema_info[f"{db}_db"][table] = [dict(row) for row in cursor.fetchall()]
+                
+                self._schema_cache = schema_info
+                return schema_info
+            except Exception as e:
+                logger.exception(f"Error getting database schema: {e}")
+                return {}
     
-    def execute_dynamic_query(self, query: str, params: tuple = (), db: str = "services"):
-        """Execute dynamic queries safely"""
+    def has_table(self, db: str, table: str) -> bool:
+        """Check table existence against the cached schema instead of probing with a query"""
+        return table in self.get_database_schema().get(f"{db}_db", {})
+    
+    def execute_dynamic_query(self, query: str, params: tuple = (), db: str = "services", as_rows: bool = False):
+        """Execute dynamic queries safely; as_rows returns sqlite3.Row objects instead of dicts"""
         try:
-            conn = self.services_conn if db == "services" else self.appointments_conn
-            cursor = conn.execute(query, params)
-            if query.strip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')):
-                conn.commit()
-                return cursor.lastrowid if query.strip().upper().startswith('INSERT') else cursor.rowcount
-            else:
-                return [dict(row) for row in cursor.fetchall()]
+            kind = statement_kind(query)
+            is_write = kind in ('INSERT', 'UPDATE', 'DELETE')
+            with self.connection(db, write=is_write) as conn:
+                cursor = conn.execute(query, params)
+                if is_write:
+                    conn.commit()
+                    if db == "services":
+                        self.invalidate_context(query)
+                    else:
+                        self.appointments_version += 1
+                    return cursor.lastrowid if kind == 'INSERT' else cursor.rowcount
+                elif as_rows:
+                    return cursor.fetchall()
+                else:
+                    return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             logger.exception(f"Error executing query: {e}")
             return None
     
+    def execute_transaction(self, work, db: str = "appointments"):
+        """Run work(conn) on the writer inside one BEGIN IMMEDIATE transaction, rolling back on error"""
+        with self.connection(db, write=True) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(conn)
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            if db == "appointments":
+                self.appointments_version += 1
+            return result
+    
+    def fetch_many(self, queries: tuple, db: str = "services"):
+        """Run several read queries on one pooled connection inside a single read transaction"""
+        with self.connection(db) as conn:
+            conn.execute("BEGIN")
+            try:
+                return [conn.execute(query).fetchall() for query in queries]
+            finally:
+                conn.rollback()
+    
+    async def execute_async(self, query: str, params: tuple = (), db: str = "services", as_rows: bool = False):
+        """Run execute_dynamic_query in a worker thread so the event loop stays free"""
+        return await asyncio.to_thread(self.execute_dynamic_query, query, params, db, as_rows)
+    
+    async def execute_listing(self, query: str, params: tuple = (), db: str = "services"):
+        """Run a repeated listing read, reusing the rows until its database changes or DIRECTORY_CACHE_TTL passes"""
+        # Services listings only read the directory tables, so they follow CONTEXT_VERSION
+        version = CONTEXT_VERSION if db == "services" else self.appointments_version
+        cached = self._listing_cache.get((db, query, params))
+        if cached and cached[0] == version and time.monotonic() - cached[1] < DIRECTORY_CACHE_TTL:
+            return cached[2]
+        rows = await self.execute_async(query, params, db)
+        if rows is not None:
+            self._listing_cache[(db, query, params)] = (version, time.monotonic(), rows)
+        return rows
+    
+    def log_interactions(self, rows: list):
+        """Insert a batch of enhanced_interaction_logs rows in one transaction"""
+        try:
+            with self.connection("appointments", write=True) as conn:
+                with conn:
+                    conn.executemany(INTERACTION_LOG_INSERT_SQL, rows)
+        except Exception as e:
+            logger.exception(f"Error logging interactions: {e}")
+    
+    def invalidate_context(self, query: str):
+        """Mark the cached AI context stale when a write touches clinics, doctors or services"""
+        global CONTEXT_VERSION
+        words = query.lower().replace("(", " ").split()
+        if any(table in words for table in CONTEXT_TABLES):
+            CONTEXT_VERSION += 1
+    
     def generate_appointment_number(self):
         """Generate unique appointment number"""
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        return f"APT-{timestamp}"
+        # Millisecond time plus a random suffix, so bookings in the same second do not collide
+        return f"APT-{time.time_ns() // 1_000_000:013d}-{secrets.token_hex(2)}"
 
-# Initialize database manager
-db_manager = DatabaseManager()
+# Initialize database manager; connections open with mode=ro/rw, so a missing file fails here
+# instead of being created empty. Run as a script the error is reported with the setup hint,
+# imported it propagates to the importer
+try:
+    db_manager = DatabaseManager()
+except sqlite3.OperationalError as e:
+    if __name__ != "__main__":
+        raise
+    print(f"\n❌ Could not open the databases ({SERVICES_DB_PATH}, {APPOINTMENTS_DB_PATH}): {e}")
+    print("🔧 If they are missing, please run: python healthcare_db_setup.py")
+    sys.exit(1)
 
 # ------------------------------------------------------------------------------
 # Enhanced Gemini AI Manager Class
@@ -246,8 +556,145 @@ db_manager = DatabaseManager()
 class GeminiAIManager:
     def __init__(self):
         self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_WORKERS, thread_name_prefix="gemini")
+        self.request_slots = asyncio.Semaphore(GEMINI_MAX_CONCURRENT_REQUESTS)
         self.conversation_history = {}
+        self.last_seen = {}
         self.system_context = self.build_dynamic_context()
+        self._context_version = CONTEXT_VERSION
+        self._context_built_at = time.monotonic()
+        self.response_cache = {}
+        self._directory_cache = {"data": None, "ts": 0.0, "version": None}
+        self._services_list_cache = {"text": None, "ts": 0.0, "version": None}
+        self._log_queue = None
+        self._log_held = []
+        self._log_lock = None
+        self._log_batch_ready = None
+        self._log_task = None
+    
+    def log_interaction(self, params: tuple):
+        """Queue one enhanced_interaction_logs row, starting the flusher on first use"""
+        if self._log_task is None or self._log_task.done():
+            self._log_queue = asyncio.Queue()
+            self._log_lock = asyncio.Lock()
+            self._log_batch_ready = asyncio.Event()
+            self._log_task = asyncio.create_task(self.flush_interaction_logs())
+        self._log_queue.put_nowait(params)
+        if len(self._log_held) + self._log_queue.qsize() >= LOG_BATCH_SIZE:
+            self._log_batch_ready.set()
+    
+    def evict_idle_sessions(self):
+        """Forget conversation history for sessions idle longer than SESSION_IDLE_TIMEOUT"""
+        cutoff = time.monotonic() - SESSION_IDLE_TIMEOUT
+        for session_id in [sid for sid, seen in self.last_seen.items() if seen < cutoff]:
+            self.conversation_history.pop(session_id, None)
+            del self.last_seen[session_id]
+    
+    def take_pending_logs(self, limit: int = None):
+        """Move the held and queued log rows into a batch without waiting"""
+        rows, self._log_held = self._log_held, []
+        while self._log_queue is not None and not self._log_queue.empty() and (limit is None or len(rows) < limit):
+            rows.append(self._log_queue.get_nowait())
+        return rows
+    
+    async def flush_interaction_logs(self):
+        """Background task writing queued interaction logs in batched transactions"""
+        try:
+            while True:
+                # The first row is held where write_pending_logs can still see it during the wait
+                self._log_held.append(await self._log_queue.get())
+                self._log_batch_ready.clear()
+                if len(self._log_held) + self._log_queue.qsize() < LOG_BATCH_SIZE:
+                    try:
+                        await asyncio.wait_for(self._log_batch_ready.wait(), LOG_FLUSH_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                async with self._log_lock:
+                    batch = self.take_pending_logs(LOG_BATCH_SIZE)
+                    if batch:
+                        await asyncio.to_thread(db_manager.log_interactions, batch)
+                self.evict_idle_sessions()
+        finally:
+            # Write whatever is still pending so shutdown does not drop logs
+            rows = self.take_pending_logs()
+            if rows:
+                db_manager.log_interactions(rows)
+    
+    async def write_pending_logs(self):
+        """Write held and queued logs now, for callers that read or update them right away"""
+        if self._log_lock is None:
+            return
+        # The lock also waits out a batch the flusher is writing at this moment
+        async with self._log_lock:
+            rows = self.take_pending_logs()
+            if rows:
+                await asyncio.to_thread(db_manager.log_interactions, rows)
+    
+    def response_cache_key(self, user_message: str, intent: str, history: list):
+        """Key a reply on the normalized message, its intent and the turn it answers"""
+        last_reply = history[-1] if history else ""
+        return (" ".join(user_message.lower().split()), intent, last_reply, CONTEXT_VERSION)
+    
+    def cache_response(self, key, ai_response: str):
+        """Store a reply, evicting the oldest entry once the cache is full"""
+        self.response_cache.pop(key, None)
+        if len(self.response_cache) >= RESPONSE_CACHE_MAX_ENTRIES:
+            self.response_cache.pop(next(iter(self.response_cache)))
+        self.response_cache[key] = (time.monotonic(), ai_response)
+    
+    async def get_directory_context(self):
+        """Return the services, doctors and clinics lists for chat context, cached for DIRECTORY_CACHE_TTL"""
+        cache = self._directory_cache
+        if (cache["data"] is not None and cache["version"] == CONTEXT_VERSION
+                and time.monotonic() - cache["ts"] < DIRECTORY_CACHE_TTL):
+            return cache["data"]
+        # All three lists are read on one pooled connection in a single worker-thread hop
+        available_services, available_doctors, clinics = await asyncio.to_thread(db_manager.fetch_many, (
+            "SELECT id, name, department FROM services ORDER BY name",
+            "SELECT id, name, specialty FROM doctors ORDER BY name",
+            "SELECT id, name, phone FROM clinics ORDER BY name",
+        ))
+        cache["data"] = {
+            "available_services": available_services,
+            "available_doctors": available_doctors,
+            "clinics": clinics,
+        }
+        cache["ts"] = time.monotonic()
+        cache["version"] = CONTEXT_VERSION
+        return cache["data"]
+    
+    def get_services_list(self):
+        """Return the formatted service list for the symptom prompt, cached like the directory lists"""
+        cache = self._services_list_cache
+        if (cache["text"] is not None and cache["version"] == CONTEXT_VERSION
+                and time.monotonic() - cache["ts"] < DIRECTORY_CACHE_TTL):
+            return cache["text"]
+        current_services = db_manager.execute_dynamic_query("""
+            SELECT name, description, department FROM services ORDER BY department
+        """, as_rows=True)
+        cache["text"] = "\n".join([f"- {s['name']} ({s['department']}): {s['description']}" for s in current_services])
+        cache["ts"] = time.monotonic()
+        cache["version"] = CONTEXT_VERSION
+        return cache["text"]
+    
+    def system_context_stale(self) -> bool:
+        """Whether the cached system context predates the last data change or CONTEXT_CACHE_TTL"""
+        age = time.monotonic() - self._context_built_at
+        return self._context_version != CONTEXT_VERSION or age >= CONTEXT_CACHE_TTL
+    
+    def get_system_context(self):
+        """Return the cached system context, rebuilding it only when stale"""
+        if self.system_context_stale():
+            self.system_context = self.build_dynamic_context()
+            self._context_version = CONTEXT_VERSION
+            self._context_built_at = time.monotonic()
+        return self.system_context
+    
+    async def get_system_context_async(self):
+        """Return the system context, rebuilding a stale one on a worker thread instead of the event loop"""
+        if self.system_context_stale():
+            return await asyncio.to_thread(self.get_system_context)
+        return self.system_context
     
     def build_dynamic_context(self):
         """Build dynamic system context based on current database state"""
@@ -255,30 +702,28 @@ class GeminiAIManager:
             # Get current database schema
             schema = db_manager.get_database_schema()
             
-            # Get current services
-            services = db_manager.execute_dynamic_query("""
+            # Services, doctors and clinics are read in one pool checkout and one read transaction
+            services, doctors, clinics = db_manager.fetch_many((
+                """
                 SELECT s.id, s.name, s.description, s.duration_minutes, s.price, s.department,
                        c.name as clinic_name, c.address, c.operating_hours
                 FROM services s
                 JOIN clinics c ON s.clinic_id = c.id
                 ORDER BY s.department, s.name
-            """)
-            
-            # Get current doctors
-            doctors = db_manager.execute_dynamic_query("""
+                """,
+                """
                 SELECT d.id, d.name, d.specialty, d.phone, d.working_hours_display,
                        c.name as clinic_name, d.available_days
                 FROM doctors d
                 JOIN clinics c ON d.clinic_id = c.id
                 ORDER BY d.specialty, d.name
-            """)
-            
-            # Get current clinics
-            clinics = db_manager.execute_dynamic_query("""
+                """,
+                """
                 SELECT id, name, address, city, state, phone, operating_hours
                 FROM clinics
                 ORDER BY name
-            """)
+                """,
+            ))
             
             services_text = "\n".join([
                 f"• {s['name']} - {s['department']} - ₹{s['price']} ({s['duration_minutes']} mins)\n"
@@ -385,7 +830,7 @@ Always start conversations with a warm greeting and ask how you can help with th
         """Generate comprehensive AI patient summary for doctors (200 words)"""
         try:
             # Build summary prompt
-            conversation_text = "\n".join(conversation_history[-20:])  # Last 20 messages
+            conversation_text = "\n".join(conversation_history)  # At most the last HISTORY_MAX_MESSAGES
             
             summary_prompt = f"""
 Generate a comprehensive 200-word patient summary for the attending doctor based on the appointment booking conversation.
@@ -417,14 +862,7 @@ Generate exactly 200 words covering:
 Format as a professional medical summary for doctor review.
 """
 
-            # Generate AI summary
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, self.model.generate_content, summary_prompt
-            )
-            
-            main_summary = response.text[:1000]  # Ensure reasonable length
-            
-            # Generate additional AI insights
+            # Additional AI insights
             insights_prompt = f"""
 Based on the patient information and conversation, provide:
 
@@ -432,13 +870,17 @@ Based on the patient information and conversation, provide:
 2. PRELIMINARY ASSESSMENT (one sentence):
 3. SUGGESTED QUESTIONS FOR DOCTOR (3-4 questions):
 
-Patient Data: {json.dumps(patient_data, indent=2)}
+Patient Data: {dumps(patient_data)}
 """
             
-            insights_response = await asyncio.get_event_loop().run_in_executor(
-                None, self.model.generate_content, insights_prompt
+            # The summary and insights are independent, so generate them concurrently
+            # with the SDK's async client, which needs no worker thread
+            response, insights_response = await asyncio.gather(
+                self.generate_content_async(summary_prompt),
+                self.generate_content_async(insights_prompt),
             )
             
+            main_summary = response.text[:1000]  # Ensure reasonable length
             insights_text = insights_response.text
             
             # Parse insights
@@ -446,18 +888,16 @@ Patient Data: {json.dumps(patient_data, indent=2)}
             preliminary_assessment = "Patient requires thorough examination based on reported symptoms."
             suggested_questions = "1. When did symptoms first appear? 2. Any triggers? 3. Previous similar episodes? 4. Current medications?"
             
-            try:
-                lines = insights_text.split('\n')
-                for line in lines:
-                    if 'FOCUS AREAS' in line.upper():
-                        focus_areas = line.split(':', 1)[1].strip() if ':' in line else focus_areas
-                    elif 'PRELIMINARY' in line.upper():
-                        preliminary_assessment = line.split(':', 1)[1].strip() if ':' in line else preliminary_assessment
-                    elif 'QUESTIONS' in line.upper():
-                        remaining_lines = lines[lines.index(line):]
-                        suggested_questions = '\n'.join(remaining_lines).replace('SUGGESTED QUESTIONS FOR DOCTOR:', '').strip()
-            except:
-                pass
+            for match in INSIGHT_SECTION_PATTERN.finditer(insights_text):
+                section = match.group(1).upper()
+                if section == 'QUESTIONS':
+                    suggested_questions = insights_text[match.start(2):].strip() or suggested_questions
+                    break
+                value = match.group(2).strip()
+                if value and section == 'FOCUS AREAS':
+                    focus_areas = value
+                elif value:
+                    preliminary_assessment = value
             
             return {
                 'ai_patient_summary': main_summary,
@@ -475,53 +915,92 @@ Patient Data: {json.dumps(patient_data, indent=2)}
                 'ai_suggested_questions': "1. Please describe your symptoms in detail. 2. When did this start? 3. Any previous medical history? 4. Current medications?"
             }
     
-    async def generate_response(self, user_message: str, session_id: str = "default", context_data: dict = None):
-        """Generate AI response using Gemini with conversation history"""
+    async def generate_content_async(self, prompt: str):
+        """Run one non-streamed Gemini completion once a request slot is free"""
+        async with self.request_slots:
+            return await self.model.generate_content_async(prompt)
+    
+    async def stream_completion(self, prompt: str, on_chunk=None):
+        """Stream a Gemini completion from a worker thread, passing each text chunk to on_chunk as it arrives"""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        
+        def produce():
+            try:
+                for chunk in self.model.generate_content(prompt, stream=True):
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk.text)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+        
+        # The request slot is held until the whole stream has been read
+        async with self.request_slots:
+            producer = loop.run_in_executor(self.executor, produce)
+            parts = []
+            while (text := await chunks.get()) is not None:
+                parts.append(text)
+                if on_chunk:
+                    on_chunk(text)
+            await producer  # Surface any error raised by the stream
+        return "".join(parts)
+    
+    async def generate_response(self, user_message: str, session_id: str = "default", context_data: dict = None, on_chunk=None):
+        """Generate AI response using Gemini with conversation history, streaming text to on_chunk"""
         try:
             # Initialize conversation history for new sessions
-            if session_id not in self.conversation_history:
-                self.conversation_history[session_id] = []
+            history = self.conversation_history.get(session_id)
+            if history is None:
+                history = self.conversation_history[session_id] = deque(maxlen=HISTORY_MAX_MESSAGES)
+            self.last_seen[session_id] = time.monotonic()
             
-            # Add current database context if provided
-            enhanced_context = self.system_context
-            if context_data:
-                enhanced_context += f"\n\nCURRENT DATABASE CONTEXT:\n{json.dumps(context_data, indent=2)}"
+            # Enhanced logging with analysis
+            intent_detected, entities = self.analyze_message(user_message)
+            confidence = 0.85  # Placeholder for confidence scoring
             
-            # Build conversation prompt
-            conversation_prompt = f"{enhanced_context}\n\n"
+            # Messages carrying entities (pain level, timing) are personalized and never cached
+            cache_key = None
+            if not entities:
+                cache_key = self.response_cache_key(user_message, intent_detected, history)
+                cached = self.response_cache.get(cache_key)
+                if cached and time.monotonic() - cached[0] < RESPONSE_CACHE_TTL:
+                    ai_response = cached[1]
+                    if on_chunk:
+                        on_chunk(ai_response)
+                    history.append(f"Patient: {user_message}")
+                    history.append(f"HealthBot AI: {ai_response}")
+                    self.log_interaction((
+                        session_id, user_message, ai_response, "conversation", intent_detected,
+                        json.dumps(entities), confidence, datetime.now().isoformat(), 0))
+                    return ai_response
+            
+            # The static system context is cached; only the per-turn parts are serialized here
+            parts = [await self.get_system_context_async()]
+            if context_data:
+                parts.append(f"\n\nCURRENT DATABASE CONTEXT:\n{dumps(context_data)}")
+            parts.append("\n\n")
             
             # Add conversation history
-            for msg in self.conversation_history[session_id][-10:]:  # Keep last 10 messages
-                conversation_prompt += f"{msg}\n"
+            recent = islice(history, max(0, len(history) - PROMPT_HISTORY_MESSAGES), None)
+            parts.extend(f"{msg}\n" for msg in recent)
             
-            conversation_prompt += f"Patient: {user_message}\nHealthBot AI: "
+            parts.append(f"Patient: {user_message}\nHealthBot AI: ")
+            conversation_prompt = "".join(parts)
             
             # Generate response
-            start_time = datetime.now()
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, self.model.generate_content, conversation_prompt
-            )
-            processing_time = (datetime.now() - start_time).total_seconds() * 1000
-            
-            ai_response = response.text
+            start_ns = time.perf_counter_ns()
+            ai_response = await self.stream_completion(conversation_prompt, on_chunk)
+            processing_time = (time.perf_counter_ns() - start_ns) // 1_000_000
+            if cache_key is not None:
+                self.cache_response(cache_key, ai_response)
             
             # Update conversation history
-            self.conversation_history[session_id].append(f"Patient: {user_message}")
-            self.conversation_history[session_id].append(f"HealthBot AI: {ai_response}")
-            
-            # Enhanced logging with analysis
-            intent_detected = self.detect_intent(user_message)
-            entities = self.extract_entities(user_message)
-            confidence = 0.85  # Placeholder for confidence scoring
+            history.append(f"Patient: {user_message}")
+            history.append(f"HealthBot AI: {ai_response}")
             
             # Log interaction
-            db_manager.execute_dynamic_query("""
-                INSERT INTO enhanced_interaction_logs 
-                (session_id, user_input, ai_response, conversation_step, intent_detected, 
-                 entities_extracted, confidence_score, timestamp, processing_time_ms)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (session_id, user_message, ai_response, "conversation", intent_detected,
-                  json.dumps(entities), confidence, datetime.now().isoformat(), int(processing_time)), "appointments")
+            # Queued for the background flusher so the insert stays off the reply path
+            self.log_interaction((
+                session_id, user_message, ai_response, "conversation", intent_detected,
+                json.dumps(entities), confidence, datetime.now().isoformat(), int(processing_time)))
             
             return ai_response
             
@@ -529,36 +1008,34 @@ Patient Data: {json.dumps(patient_data, indent=2)}
             logger.exception(f"Error generating AI response: {e}")
             return "I apologize, but I'm having trouble processing your request right now. Please try again or contact our clinic directly."
     
-    def detect_intent(self, user_message: str) -> str:
-        """Simple intent detection"""
+    def analyze_message(self, user_message: str):
+        """Detect intent and extract entities from a single keyword scan of the message"""
         user_lower = user_message.lower()
-        if any(word in user_lower for word in ['book', 'appointment', 'schedule']):
-            return 'book_appointment'
-        elif any(word in user_lower for word in ['pain', 'hurt', 'ache', 'sick']):
-            return 'symptom_inquiry'
-        elif any(word in user_lower for word in ['doctor', 'specialist']):
-            return 'doctor_inquiry'
-        elif any(word in user_lower for word in ['cost', 'price', 'fee']):
-            return 'pricing_inquiry'
-        else:
-            return 'general_inquiry'
-    
-    def extract_entities(self, user_message: str) -> dict:
-        """Simple entity extraction"""
+        found = {match.group() for match in KEYWORD_PATTERN.finditer(user_lower)}
+        kinds = {KEYWORD_KINDS[word] for word in found}
+        
+        intent = next((intent for intent in INTENT_KEYWORDS if intent in kinds), 'general_inquiry')
+        
         entities = {}
-        user_lower = user_message.lower()
         
         # Extract pain level
-        import re
-        pain_match = re.search(r'(\d+)\s*(?:out of|/)\s*10|pain.*?(\d+)', user_lower)
+        pain_match = PAIN_LEVEL_PATTERN.search(user_lower)
         if pain_match:
             entities['pain_level'] = pain_match.group(1) or pain_match.group(2)
         
         # Extract time references
-        if any(word in user_lower for word in ['today', 'tomorrow', 'morning', 'evening', 'afternoon']):
-            entities['time_preference'] = [word for word in ['today', 'tomorrow', 'morning', 'evening', 'afternoon'] if word in user_lower]
+        if 'time' in kinds:
+            entities['time_preference'] = [word for word in TIME_WORDS if word in found]
         
-        return entities
+        return intent, entities
+    
+    def detect_intent(self, user_message: str) -> str:
+        """Simple intent detection"""
+        return self.analyze_message(user_message)[0]
+    
+    def extract_entities(self, user_message: str) -> dict:
+        """Simple entity extraction"""
+        return self.analyze_message(user_message)[1]
 
 # Initialize AI manager
 ai_manager = GeminiAIManager()
@@ -582,8 +1059,8 @@ def get_all_services() -> str:
             FROM services s
             JOIN clinics c ON s.clinic_id = c.id
             ORDER BY s.department, s.name
-        """)
-        return json.dumps(services, indent=2)
+        """, as_rows=True)
+        return dumps(services)
     except Exception as e:
         logger.exception(f"Error retrieving services: {e}")
         return json.dumps({"error": str(e)})
@@ -593,24 +1070,21 @@ def get_available_doctors() -> str:
     """Get all doctors with their current availability"""
     logger.info("Fetching available doctors")
     try:
+        # Count today's open slots for every doctor in the same query;
+        # time_slots numbers days 1 (Monday) to 7 (Sunday), matching isoweekday()
+        today = datetime.now().isoweekday()
         doctors = db_manager.execute_dynamic_query("""
-            SELECT d.*, c.name as clinic_name, c.address, c.operating_hours
+            SELECT d.*, c.name as clinic_name, c.address, c.operating_hours,
+                   COALESCE(SUM(CASE WHEN ts.day_of_week = ? AND ts.is_available = 1 THEN 1 ELSE 0 END), 0)
+                       as available_slots_today
             FROM doctors d
             JOIN clinics c ON d.clinic_id = c.id
+            LEFT JOIN time_slots ts ON ts.doctor_id = d.id
+            GROUP BY d.id
             ORDER BY d.specialty, d.name
-        """)
-        
-        # Add current time slot availability
-        for doctor in doctors:
-            today = datetime.now().strftime('%w')  # Get day of week
-            slots = db_manager.execute_dynamic_query("""
-                SELECT COUNT(*) as available_slots
-                FROM time_slots
-                WHERE doctor_id = ? AND day_of_week = ? AND is_available = 1
-            """, (doctor['id'], today))
-            doctor['available_slots_today'] = slots[0]['available_slots'] if slots else 0
+        """, (today,), as_rows=True)
         
-        return json.dumps(doctors, indent=2)
+        return dumps(doctors)
     except Exception as e:
         logger.exception(f"Error retrieving doctors: {e}")
         return json.dumps({"error": str(e)})
@@ -627,8 +1101,8 @@ def get_recent_appointments() -> str:
             FROM enhanced_appointments 
             ORDER BY created_at DESC 
             LIMIT 10
-        """, (), "appointments")
-        return json.dumps(appointments, indent=2)
+        """, (), "appointments", as_rows=True)
+        return dumps(appointments)
     except Exception as e:
         logger.exception(f"Error retrieving recent appointments: {e}")
         return json.dumps({"error": str(e)})
@@ -647,8 +1121,8 @@ def get_all_clinics() -> str:
             LEFT JOIN services s ON c.id = s.clinic_id
             GROUP BY c.id
             ORDER BY c.name
-        """)
-        return json.dumps(clinics, indent=2)
+        """, as_rows=True)
+        return dumps(clinics)
     except Exception as e:
         logger.exception(f"Error retrieving clinics: {e}")
         return json.dumps({"error": str(e)})
@@ -658,27 +1132,48 @@ def get_all_clinics() -> str:
 # ------------------------------------------------------------------------------
 
 @mcp.tool()
-async def chat_with_ai(user_message: str, session_id: str = "default") -> str:
+async def chat_with_ai(user_message: str, session_id: str = "default", ctx: Context = None) -> str:
     """Main chat interface with Gemini AI"""
     logger.info(f"Processing chat message for session {session_id}")
     try:
-        # Get fresh database context
+        # Directory lists come from a short-lived cache; a stale system context is rebuilt
+        # alongside them so both database reads finish before the prompt is built.
+        # Only the time is fresh per message, read once and reused for the response timestamp
+        directory, _ = await asyncio.gather(ai_manager.get_directory_context(), ai_manager.get_system_context_async())
+        now = datetime.now()
         context_data = {
-            "available_services": db_manager.execute_dynamic_query("SELECT id, name, department FROM services ORDER BY name"),
-            "available_doctors": db_manager.execute_dynamic_query("SELECT id, name, specialty FROM doctors ORDER BY name"),
-            "clinics": db_manager.execute_dynamic_query("SELECT id, name, phone FROM clinics ORDER BY name"),
-            "current_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "day_of_week": datetime.now().strftime("%A")
+            **directory,
+            "current_time": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "day_of_week": now.strftime("%A")
         }
         
-        # Generate AI response
-        ai_response = await ai_manager.generate_response(user_message, session_id, context_data)
+        # Stream reply text to the client as log notifications while it is generated;
+        # one forwarding task keeps the chunks in order
+        chunks = asyncio.Queue()
         
-        return json.dumps({
+        async def forward_chunks():
+            while (text := await chunks.get()) is not None:
+                try:
+                    await ctx.info(text)
+                except Exception as e:
+                    logger.warning(f"Could not stream chat chunk to client: {e}")
+        
+        forwarder = asyncio.create_task(forward_chunks()) if ctx else None
+        try:
+            # Generate AI response
+            ai_response = await ai_manager.generate_response(
+                user_message, session_id, context_data, on_chunk=chunks.put_nowait if ctx else None
+            )
+        finally:
+            if forwarder:
+                chunks.put_nowait(None)
+                await forwarder
+        
+        return dumps({
             "success": True,
             "response": ai_response,
             "session_id": session_id,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now.isoformat()
         })
         
     except Exception as e:
@@ -694,23 +1189,38 @@ def search_services_intelligent(query: str) -> str:
     """Intelligent service search with symptom matching"""
     logger.info(f"Intelligent search for: {query}")
     try:
-        # Search in name, description, and department
-        services = db_manager.execute_dynamic_query("""
-            SELECT s.*, c.name as clinic_name, c.address, c.phone as clinic_phone,
-                   d.name as doctor_name, d.specialty, d.working_hours_display
-            FROM services s
-            JOIN clinics c ON s.clinic_id = c.id
-            LEFT JOIN doctor_services ds ON s.id = ds.service_id
-            LEFT JOIN doctors d ON ds.doctor_id = d.id
-            WHERE s.name LIKE ? OR s.description LIKE ? OR s.department LIKE ?
-            ORDER BY s.department, s.name
-        """, (f"%{query}%", f"%{query}%", f"%{query}%"))
+        # Search in name, description, and department through the trigram index, best matches first
+        services = None
+        if len(query.strip()) >= SERVICES_SEARCH_MIN_LENGTH and db_manager.has_table("services", "services_search"):
+            services = db_manager.execute_dynamic_query("""
+                SELECT s.*, c.name as clinic_name, c.address, c.phone as clinic_phone,
+                       d.name as doctor_name, d.specialty, d.working_hours_display
+                FROM services_search f
+                JOIN services s ON s.id = f.rowid
+                JOIN clinics c ON s.clinic_id = c.id
+                LEFT JOIN doctor_services ds ON s.id = ds.service_id
+                LEFT JOIN doctors d ON ds.doctor_id = d.id
+                WHERE services_search MATCH ?
+                ORDER BY bm25(services_search), s.department, s.name
+            """, ('"{}"'.format(query.strip().replace('"', '""')),), as_rows=True)
+        if services is None:
+            # Short terms, databases without the index and SQLite builds without FTS5 keep the substring scan
+            services = db_manager.execute_dynamic_query("""
+                SELECT s.*, c.name as clinic_name, c.address, c.phone as clinic_phone,
+                       d.name as doctor_name, d.specialty, d.working_hours_display
+                FROM services s
+                JOIN clinics c ON s.clinic_id = c.id
+                LEFT JOIN doctor_services ds ON s.id = ds.service_id
+                LEFT JOIN doctors d ON ds.doctor_id = d.id
+                WHERE s.name LIKE ? OR s.description LIKE ? OR s.department LIKE ?
+                ORDER BY s.department, s.name
+            """, (f"%{query}%", f"%{query}%", f"%{query}%"), as_rows=True)
         
-        return json.dumps({
+        return dumps({
             "query": query,
             "results": services,
             "count": len(services)
-        }, indent=2)
+        })
         
     except Exception as e:
         logger.exception(f"Error in intelligent search: {e}")
@@ -721,37 +1231,17 @@ def get_real_time_availability(doctor_id: int = None, service_id: int = None, da
     """Get real-time availability based on current database state"""
     logger.info(f"Getting availability - doctor: {doctor_id}, service: {service_id}, day: {day_preference}")
     try:
-        query_parts = ["SELECT DISTINCT ts.*, d.name as doctor_name, d.specialty, c.name as clinic_name"]
-        from_parts = ["FROM time_slots ts"]
-        join_parts = ["JOIN doctors d ON ts.doctor_id = d.id", "JOIN clinics c ON d.clinic_id = c.id"]
-        where_parts = ["ts.is_available = 1"]
-        params = []
-        
-        if doctor_id:
-            where_parts.append("ts.doctor_id = ?")
-            params.append(doctor_id)
-        
-        if service_id:
-            join_parts.append("JOIN doctor_services ds ON d.id = ds.doctor_id")
-            where_parts.append("ds.service_id = ?")
-            params.append(service_id)
+        day_num = DAY_NUMBERS.get(day_preference.lower()) if day_preference else None
+        query = AVAILABILITY_QUERIES[(bool(doctor_id), bool(service_id), bool(day_num))]
+        params = tuple(value for value in (doctor_id, service_id, day_num) if value)
         
-        if day_preference:
-            day_mapping = {"monday": 1, "tuesday": 2, "wednesday": 3, "thursday": 4, "friday": 5, "saturday": 6, "sunday": 7}
-            day_num = day_mapping.get(day_preference.lower())
-            if day_num:
-                where_parts.append("ts.day_of_week = ?")
-                params.append(day_num)
+        availability = db_manager.execute_dynamic_query(query, params, as_rows=True)
         
-        query = f"{' '.join(query_parts)} {' '.join(from_parts)} {' '.join(join_parts)} WHERE {' AND '.join(where_parts)} ORDER BY ts.day_of_week, ts.start_time"
-        
-        availability = db_manager.execute_dynamic_query(query, tuple(params))
-        
-        return json.dumps({
+        return dumps({
             "availability": availability,
             "total_slots": len(availability),
             "query_params": {"doctor_id": doctor_id, "service_id": service_id, "day_preference": day_preference}
-        }, indent=2)
+        })
         
     except Exception as e:
         logger.exception(f"Error getting availability: {e}")
@@ -763,37 +1253,10 @@ def create_patient_intelligent(patient_data: str) -> str:
     logger.info("Creating patient with intelligent parsing")
     try:
         # Parse JSON patient data
-        data = json.loads(patient_data) if isinstance(patient_data, str) else patient_data
+        data = loads(patient_data)
         
-        # Insert patient if patients table exists
-        try:
-            result = db_manager.execute_dynamic_query("""
-                INSERT INTO patients (name, phone, email, age, gender, address, medical_history, emergency_contact)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                data.get('name'),
-                data.get('phone'),
-                data.get('email'),
-                data.get('age'),
-                data.get('gender'),
-                data.get('address'),
-                data.get('medical_history'),
-                data.get('emergency_contact')
-            ), "appointments")
-            
-            # Get the created patient
-            patient = db_manager.execute_dynamic_query("""
-                SELECT * FROM patients WHERE rowid = last_insert_rowid()
-            """, (), "appointments")
-            
-            return json.dumps({
-                "success": True,
-                "patient": patient[0] if patient else {},
-                "patient_id": result,
-                "message": f"Patient {data.get('name')} created successfully"
-            })
-        except:
-            # If patients table doesn't exist, return patient data for direct appointment creation
+        # If patients table doesn't exist, return patient data for direct appointment creation
+        if not db_manager.has_table("appointments", "patients"):
             return json.dumps({
                 "success": True,
                 "patient_data": data,
@@ -801,6 +1264,28 @@ def create_patient_intelligent(patient_data: str) -> str:
                 "message": f"Patient data prepared for appointment creation"
             })
         
+        result = db_manager.execute_dynamic_query("""
+            INSERT INTO patients (name, phone, email, age, gender, address, medical_history, emergency_contact)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            data.get('name'),
+            data.get('phone'),
+            data.get('email'),
+            data.get('age'),
+            data.get('gender'),
+            data.get('address'),
+            data.get('medical_history'),
+            data.get('emergency_contact')
+        ), "appointments")
+        
+        # The INSERT already returns cursor.lastrowid, so the row is echoed from the input instead of read back
+        return dumps({
+            "success": True,
+            "patient": {"id": result, **data} if result else {},
+            "patient_id": result,
+            "message": f"Patient {data.get('name')} created successfully"
+        })
+        
     except Exception as e:
         logger.exception(f"Error creating patient: {e}")
         return json.dumps({"success": False, "error": str(e)})
@@ -810,68 +1295,29 @@ async def book_appointment_comprehensive(booking_data: str, session_id: str = "d
     """Enhanced appointment booking with comprehensive data storage and AI summary"""
     logger.info("Processing comprehensive appointment booking")
     try:
-        data = json.loads(booking_data) if isinstance(booking_data, str) else booking_data
+        data = loads(booking_data)
         
         # Extract booking details
         patient_data = data.get('patient_data', {})
         doctor_id = data.get('doctor_id')
         service_id = data.get('service_id')
         time_slot_id = data.get('time_slot_id')
-        appointment_date = data.get('appointment_date', datetime.now().strftime('%Y-%m-%d'))
-        
-        # Get comprehensive doctor information
-        doctor_info = db_manager.execute_dynamic_query("""
-            SELECT d.*, c.name as clinic_name, c.address as clinic_address, 
-                   c.phone as clinic_phone, c.operating_hours
-            FROM doctors d
-            JOIN clinics c ON d.clinic_id = c.id
-            WHERE d.id = ?
-        """, (doctor_id,))
-        
-        if not doctor_info:
-            return json.dumps({"success": False, "error": "Doctor not found"})
-        
-        doctor = doctor_info[0]
-        
-        # Get service information
-        service_info = db_manager.execute_dynamic_query("""
-            SELECT * FROM services WHERE id = ?
-        """, (service_id,))
-        
-        if not service_info:
-            return json.dumps({"success": False, "error": "Service not found"})
-        
-        service = service_info[0]
-        
-        # Validate and get time slot information
-        slot_check = db_manager.execute_dynamic_query("""
-            SELECT * FROM time_slots WHERE id = ? AND doctor_id = ? AND is_available = 1
-        """, (time_slot_id, doctor_id))
-        
-        if not slot_check:
-            return json.dumps({"success": False, "error": "Time slot not available"})
-        
-        slot_info = slot_check[0]
-        
-        # Generate unique appointment number
-        appointment_number = db_manager.generate_appointment_number()
-        
-        # Calculate end time
-        duration = service.get('duration_minutes', 30)
-        start_time = datetime.strptime(slot_info['start_time'], '%H:%M:%S').time()
-        end_time = (datetime.combine(datetime.today(), start_time) + timedelta(minutes=duration)).time()
-        
-        # Generate AI patient summary
+        appointment_date = data.get('appointment_date') or datetime.now().strftime('%Y-%m-%d')
         conversation_history = ai_manager.conversation_history.get(session_id, [])
         
+        # Names for the AI summary come from the cached directory lists, so the summary can be
+        # generated while the booking lookup below runs instead of after it
+        directory = await ai_manager.get_directory_context()
+        known_service = next((row for row in directory["available_services"] if row["id"] == service_id), None)
+        known_doctor = next((row for row in directory["available_doctors"] if row["id"] == doctor_id), None)
+        
         # Prepare comprehensive patient data for AI summary
         comprehensive_patient_data = {
             **patient_data,
-            'service_name': service['name'],
-            'doctor_name': doctor['name'],
-            'doctor_specialty': doctor['specialty'],
+            'service_name': known_service['name'] if known_service else None,
+            'doctor_name': known_doctor['name'] if known_doctor else None,
+            'doctor_specialty': known_doctor['specialty'] if known_doctor else None,
             'appointment_date': appointment_date,
-            'appointment_time': slot_info['start_time'],
             'complaint': data.get('complaint', ''),
             'symptoms': data.get('symptoms', ''),
             'pain_level': data.get('pain_level'),
@@ -879,69 +1325,129 @@ async def book_appointment_comprehensive(booking_data: str, session_id: str = "d
             'symptoms_duration': data.get('symptoms_duration', ''),
             'medical_history': patient_data.get('medical_history', 'None reported')
         }
-        
-        # Generate AI summary
-        ai_summary_data = await ai_manager.generate_patient_summary(
+        summary_task = asyncio.create_task(ai_manager.generate_patient_summary(
             comprehensive_patient_data, 
             conversation_history
-        )
-        
-        # Assess patient mood and interaction quality
-        patient_mood = "cooperative" if len(conversation_history) > 4 else "brief"
-        interaction_quality = "excellent" if len(conversation_history) > 10 else "good"
+        ))
         
-        # Create comprehensive appointment record
-        appointment_id = db_manager.execute_dynamic_query("""
-            INSERT INTO enhanced_appointments (
-                appointment_number, patient_name, patient_phone, patient_email, patient_age, 
-                patient_gender, patient_address, patient_medical_history, patient_emergency_contact,
-                doctor_id, doctor_name, doctor_specialty, doctor_phone, doctor_qualifications,
-                clinic_id, clinic_name, clinic_address, clinic_phone, clinic_operating_hours,
-                service_id, service_name, service_description, service_department, 
-                service_price, service_duration_minutes,
-                appointment_date, appointment_time, appointment_end_time, slot_id,
-                patient_complaint, symptoms_description, symptoms_duration, pain_level, urgency_level,
-                ai_patient_summary, ai_recommended_focus_areas, ai_preliminary_assessment, ai_suggested_questions,
-                status, booking_source, special_instructions, conversation_summary,
-                patient_mood_assessment, booking_interaction_quality
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            appointment_number,
-            patient_data.get('name', ''), patient_data.get('phone', ''), patient_data.get('email', ''),
-            patient_data.get('age'), patient_data.get('gender', ''), patient_data.get('address', ''),
-            patient_data.get('medical_history', ''), patient_data.get('emergency_contact', ''),
-            doctor_id, doctor['name'], doctor['specialty'], doctor.get('phone', ''), doctor.get('qualifications', ''),
-            doctor['clinic_id'], doctor['clinic_name'], doctor['clinic_address'], 
-            doctor['clinic_phone'], doctor['operating_hours'],
-            service_id, service['name'], service.get('description', ''), service.get('department', ''),
-            service.get('price', 0), duration,
-            appointment_date, slot_info['start_time'], end_time.strftime('%H:%M:%S'), time_slot_id,
-            data.get('complaint', ''), data.get('symptoms', ''), data.get('symptoms_duration', ''),
-            data.get('pain_level'), data.get('urgency', 'normal'),
-            ai_summary_data['ai_patient_summary'], ai_summary_data['ai_recommended_focus_areas'],
-            ai_summary_data['ai_preliminary_assessment'], ai_summary_data['ai_suggested_questions'],
-            'scheduled', 'ai_assistant', data.get('special_instructions', ''),
-            f"Conversation with {len(conversation_history)} exchanges, patient was {patient_mood}",
-            patient_mood, interaction_quality
-        ), "appointments")
-        
-        # Mark time slot as unavailable
-        db_manager.execute_dynamic_query("""
-            UPDATE time_slots SET is_available = 0 WHERE id = ?
-        """, (time_slot_id,))
-        
-        # Log appointment status
-        db_manager.execute_dynamic_query("""
-            INSERT INTO appointment_status_history (appointment_id, old_status, new_status, changed_by, reason)
-            VALUES (?, NULL, 'scheduled', 'ai_assistant', 'Initial booking')
-        """, (appointment_id,), "appointments")
+        try:
+            # Doctor with clinic, the service and the time slot in one lookup; the LEFT JOINs
+            # leave the service or slot columns NULL so each missing piece gets its own error
+            booking_info = await db_manager.execute_async("""
+                SELECT d.*, c.name as clinic_name, c.address as clinic_address, 
+                       c.phone as clinic_phone, c.operating_hours,
+                       s.id as service_found, s.name as service_name, s.description as service_description,
+                       s.department as service_department, s.price as service_price,
+                       s.duration_minutes as service_duration_minutes,
+                       ts.id as slot_found, ts.start_time as slot_start_time, ts.is_available as slot_is_available
+                FROM doctors d
+                JOIN clinics c ON d.clinic_id = c.id
+                LEFT JOIN services s ON s.id = ?
+                LEFT JOIN time_slots ts ON ts.id = ? AND ts.doctor_id = d.id
+                WHERE d.id = ?
+            """, (service_id, time_slot_id, doctor_id))
+            
+            if not booking_info:
+                return json.dumps({"success": False, "error": "Doctor not found"})
+            
+            doctor = booking_info[0]
+            
+            if doctor['service_found'] is None:
+                return json.dumps({"success": False, "error": "Service not found"})
+            
+            service = {
+                'name': doctor['service_name'],
+                'description': doctor['service_description'],
+                'department': doctor['service_department'],
+                'price': doctor['service_price'],
+                'duration_minutes': doctor['service_duration_minutes'],
+            }
+            
+            if doctor['slot_found'] is None or doctor['slot_is_available'] != 1:
+                return json.dumps({"success": False, "error": "Time slot not available"})
+            
+            slot_info = {'start_time': doctor['slot_start_time']}
+            
+            # Generate unique appointment number
+            appointment_number = db_manager.generate_appointment_number()
+            
+            # Calculate end time
+            duration = service.get('duration_minutes', 30)
+            end_time = add_minutes(slot_info['start_time'], duration)
+            
+            # Wait for the AI summary while any still-queued interaction logs are written, so they can be linked below
+            ai_summary_data, _ = await asyncio.gather(summary_task, ai_manager.write_pending_logs())
+        finally:
+            # A failed lookup or validation no longer needs the summary, so it is not left running unowned
+            if not summary_task.done():
+                summary_task.cancel()
         
-        # Update interaction log with appointment ID
-        db_manager.execute_dynamic_query("""
-            UPDATE enhanced_interaction_logs 
-            SET appointment_id = ? 
-            WHERE session_id = ? AND appointment_id IS NULL
-        """, (appointment_id, session_id), "appointments")
+        # Assess patient mood and interaction quality
+        history_length = min(len(conversation_history), HISTORY_MAX_MESSAGES)
+        patient_mood = PATIENT_MOOD_BY_LENGTH[history_length]
+        interaction_quality = INTERACTION_QUALITY_BY_LENGTH[history_length]
+        
+        def write_booking(conn):
+            """Claim the slot and write the appointment, its history and log links in one transaction"""
+            # Mark time slot as unavailable, unless another booking claimed it first
+            claimed = conn.execute("""
+                UPDATE services.time_slots SET is_available = 0 WHERE id = ? AND is_available = 1
+            """, (time_slot_id,)).rowcount
+            if not claimed:
+                return None
+            
+            # Create comprehensive appointment record
+            appointment_id = conn.execute("""
+                INSERT INTO enhanced_appointments (
+                    appointment_number, patient_name, patient_phone, patient_email, patient_age, 
+                    patient_gender, patient_address, patient_medical_history, patient_emergency_contact,
+                    doctor_id, doctor_name, doctor_specialty, doctor_phone, doctor_qualifications,
+                    clinic_id, clinic_name, clinic_address, clinic_phone, clinic_operating_hours,
+                    service_id, service_name, service_description, service_department, 
+                    service_price, service_duration_minutes,
+                    appointment_date, appointment_time, appointment_end_time, slot_id,
+                    patient_complaint, symptoms_description, symptoms_duration, pain_level, urgency_level,
+                    ai_patient_summary, ai_recommended_focus_areas, ai_preliminary_assessment, ai_suggested_questions,
+                    status, booking_source, special_instructions, conversation_summary,
+                    patient_mood_assessment, booking_interaction_quality
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                appointment_number,
+                patient_data.get('name', ''), patient_data.get('phone', ''), patient_data.get('email', ''),
+                patient_data.get('age'), patient_data.get('gender', ''), patient_data.get('address', ''),
+                patient_data.get('medical_history', ''), patient_data.get('emergency_contact', ''),
+                doctor_id, doctor['name'], doctor['specialty'], doctor.get('phone', ''), doctor.get('qualifications', ''),
+                doctor['clinic_id'], doctor['clinic_name'], doctor['clinic_address'], 
+                doctor['clinic_phone'], doctor['operating_hours'],
+                service_id, service['name'], service.get('description', ''), service.get('department', ''),
+                service.get('price', 0), duration,
+                appointment_date, slot_info['start_time'], end_time, time_slot_id,
+                data.get('complaint', ''), data.get('symptoms', ''), data.get('symptoms_duration', ''),
+                data.get('pain_level'), data.get('urgency', 'normal'),
+                ai_summary_data['ai_patient_summary'], ai_summary_data['ai_recommended_focus_areas'],
+                ai_summary_data['ai_preliminary_assessment'], ai_summary_data['ai_suggested_questions'],
+                'scheduled', 'ai_assistant', data.get('special_instructions', ''),
+                f"Conversation with {len(conversation_history)} exchanges, patient was {patient_mood}",
+                patient_mood, interaction_quality
+            )).lastrowid
+            
+            # Log appointment status
+            conn.execute("""
+                INSERT INTO appointment_status_history (appointment_id, old_status, new_status, changed_by, reason)
+                VALUES (?, NULL, 'scheduled', 'ai_assistant', 'Initial booking')
+            """, (appointment_id,))
+            
+            # Update interaction log with appointment ID
+            conn.execute("""
+                UPDATE enhanced_interaction_logs 
+                SET appointment_id = ? 
+                WHERE session_id = ? AND appointment_id IS NULL
+            """, (appointment_id, session_id))
+            return appointment_id
+        
+        appointment_id = await asyncio.to_thread(db_manager.execute_transaction, write_booking)
+        if appointment_id is None:
+            return json.dumps({"success": False, "error": "Time slot not available"})
         
         # Prepare comprehensive response
         appointment_details = {
@@ -956,7 +1462,7 @@ async def book_appointment_comprehensive(booking_data: str, session_id: str = "d
             "clinic_phone": doctor['clinic_phone'],
             "appointment_date": appointment_date,
             "appointment_time": slot_info['start_time'],
-            "appointment_end_time": end_time.strftime('%H:%M:%S'),
+            "appointment_end_time": end_time,
             "duration_minutes": duration,
             "service_price": f"₹{service.get('price', 0)}",
             "ai_summary_generated": True,
@@ -964,7 +1470,7 @@ async def book_appointment_comprehensive(booking_data: str, session_id: str = "d
             "status": "scheduled"
         }
         
-        return json.dumps({
+        return dumps({
             "success": True,
             "appointment_details": appointment_details,
             "ai_summary": {
@@ -1001,11 +1507,11 @@ def get_appointment_details(appointment_number: str = None, appointment_id: int
             SELECT * FROM appointment_status_history 
             WHERE appointment_id = ? 
             ORDER BY changed_at DESC
-        """, (apt['id'],), "appointments")
+        """, (apt['id'],), "appointments", as_rows=True)
         
-        return json.dumps({
+        return dumps({
             "success": True,
-            "appointment": dict(apt),
+            "appointment": apt,
             "status_history": status_history,
             "ai_summary": {
                 "patient_summary": apt.get('ai_patient_summary', ''),
@@ -1013,7 +1519,7 @@ def get_appointment_details(appointment_number: str = None, appointment_id: int
                 "preliminary_assessment": apt.get('ai_preliminary_assessment', ''),
                 "suggested_questions": apt.get('ai_suggested_questions', '')
             }
-        }, indent=2)
+        })
         
     except Exception as e:
         logger.exception(f"Error getting appointment details: {e}")
@@ -1024,31 +1530,37 @@ def update_appointment_status(appointment_id: int, new_status: str, reason: str
     """Update appointment status with history tracking"""
     logger.info(f"Updating appointment {appointment_id} status to {new_status}")
     try:
-        # Get current status
-        current = db_manager.execute_dynamic_query("""
-            SELECT status FROM enhanced_appointments WHERE id = ?
-        """, (appointment_id,), "appointments")
-        
-        if not current:
+        def write_status(conn):
+            """Read the current status, update it and record the change in one transaction"""
+            # Get current status
+            current = conn.execute("""
+                SELECT status FROM enhanced_appointments WHERE id = ?
+            """, (appointment_id,)).fetchone()
+            if current is None:
+                return None
+            
+            # Update appointment status
+            conn.execute("""
+                UPDATE enhanced_appointments 
+                SET status = ?, updated_at = CURRENT_TIMESTAMP 
+                WHERE id = ?
+            """, (new_status, appointment_id))
+            
+            # Log status change
+            conn.execute("""
+                INSERT INTO appointment_status_history 
+                (appointment_id, old_status, new_status, changed_by, reason)
+                VALUES (?, ?, ?, ?, ?)
+            """, (appointment_id, current['status'], new_status, changed_by, reason))
+            return current
+        
+        current = db_manager.execute_transaction(write_status)
+        if current is None:
             return json.dumps({"success": False, "error": "Appointment not found"})
         
-        old_status = current[0]['status']
-        
-        # Update appointment status
-        db_manager.execute_dynamic_query("""
-            UPDATE enhanced_appointments 
-            SET status = ?, updated_at = CURRENT_TIMESTAMP 
-            WHERE id = ?
-        """, (new_status, appointment_id), "appointments")
+        old_status = current['status']
         
-        # Log status change
-        db_manager.execute_dynamic_query("""
-            INSERT INTO appointment_status_history 
-            (appointment_id, old_status, new_status, changed_by, reason)
-            VALUES (?, ?, ?, ?, ?)
-        """, (appointment_id, old_status, new_status, changed_by, reason), "appointments")
-        
-        return json.dumps({
+        return dumps({
             "success": True,
             "appointment_id": appointment_id,
             "old_status": old_status,
@@ -1076,22 +1588,22 @@ def get_doctor_appointment_summary(doctor_id: int, date: str = None) -> str:
             FROM enhanced_appointments 
             WHERE doctor_id = ? AND appointment_date = ?
             ORDER BY appointment_time
-        """, (doctor_id, date_filter), "appointments")
+        """, (doctor_id, date_filter), "appointments", as_rows=True)
         
         # Get doctor information
         doctor = db_manager.execute_dynamic_query("""
             SELECT name, specialty FROM doctors WHERE id = ?
         """, (doctor_id,))
         
-        return json.dumps({
+        return dumps({
             "success": True,
             "doctor": doctor[0] if doctor else {},
             "date": date_filter,
             "appointments": appointments,
             "total_appointments": len(appointments),
-            "urgent_cases": len([apt for apt in appointments if apt.get('urgency_level') == 'urgent']),
+            "urgent_cases": sum(1 for apt in appointments if apt['urgency_level'] == 'urgent'),
             "summary": f"Dr. {doctor[0]['name']} has {len(appointments)} appointments on {date_filter}"
-        }, indent=2)
+        })
         
     except Exception as e:
         logger.exception(f"Error getting doctor appointment summary: {e}")
@@ -1105,9 +1617,8 @@ def get_doctor_appointment_summary(doctor_id: int, date: str = None) -> str:
 def healthcare_system_prompt() -> list[Message]:
     """Comprehensive system prompt with dynamic database context"""
     try:
-        # Refresh context with current database state
-        ai_manager.system_context = ai_manager.build_dynamic_context()
-        return [UserMessage(ai_manager.system_context)]
+        # Reuse the cached context; it is rebuilt when the directory tables change
+        return [UserMessage(ai_manager.get_system_context())]
     except Exception as e:
         logger.exception(f"Error generating system prompt: {e}")
         return [UserMessage("You are a healthcare appointment scheduling assistant.")]
@@ -1115,11 +1626,8 @@ def healthcare_system_prompt() -> list[Message]:
 @mcp.prompt()
 def analyze_patient_symptoms(symptoms: str, patient_info: str = "") -> list[Message]:
     """Advanced symptom analysis prompt"""
-    current_services = db_manager.execute_dynamic_query("""
-        SELECT name, description, department FROM services ORDER BY department
-    """)
-    
-    services_list = "\n".join([f"- {s['name']} ({s['department']}): {s['description']}" for s in current_services])
+    # Formatted once per directory change rather than queried and joined on every call
+    services_list = ai_manager.get_services_list()
     
     prompt = f"""
     PATIENT SYMPTOM ANALYSIS REQUEST
@@ -1167,6 +1675,135 @@ def generate_appointment_confirmation(appointment_data: str) -> list[Message]:
 # ------------------------------------------------------------------------------
 # Enhanced Main Chat Interface
 # ------------------------------------------------------------------------------
+async def print_streamed_reply(user_message: str, session_id: str):
+    """Print the assistant's reply to the terminal chunk by chunk as Gemini streams it"""
+    print("\n🤖 HealthBot AI: ", end="", flush=True)
+    streamed = []
+    
+    def on_chunk(text):
+        streamed.append(text)
+        print(text, end="", flush=True)
+    
+    response = await ai_manager.generate_response(user_message, session_id, on_chunk=on_chunk)
+    # Fallback replies are returned without being streamed
+    if "".join(streamed) != response:
+        print(response, end="")
+    print("\n")
+    return response
+
+async def show_help():
+    """Print the terminal commands and enhanced features"""
+    print("\n📋 ENHANCED COMMANDS AVAILABLE:")
+    print("• 'services' - View all available healthcare services")
+    print("• 'doctors' - View all available doctors")
+    print("• 'clinics' - View all clinic locations")
+    print("• 'appointments' - View recent appointments with AI summaries")
+    print("• 'reset' - Start a new conversation")
+    print("• 'quit/exit/bye' - End conversation")
+    print("\n✨ ENHANCED FEATURES:")
+    print("• AI-generated 200-word patient summaries for doctors")
+    print("• Comprehensive appointment data storage")
+    print("• Smart symptom analysis and service recommendations")
+    print("• Complete patient interaction tracking")
+    print("• Just type naturally to book appointments or ask health questions!")
+    print()
+
+async def show_recent_appointments():
+    """Print the latest bookings with their AI summary previews"""
+    try:
+        recent_appointments = await db_manager.execute_listing("""
+            SELECT appointment_number, patient_name, doctor_name, service_name,
+                   appointment_date, appointment_time, status, created_at,
+                   SUBSTR(ai_patient_summary, 1, 100) as summary_preview
+            FROM enhanced_appointments 
+            ORDER BY created_at DESC 
+            LIMIT 5
+        """, (), "appointments")
+        
+        if recent_appointments:
+            print("\n📅 RECENT APPOINTMENTS WITH AI SUMMARIES:")
+            for apt in recent_appointments:
+                print(f"\n🆔 {apt['appointment_number']} - {apt['status'].upper()}")
+                print(f"👤 Patient: {apt['patient_name']}")
+                print(f"👩‍⚕️ Doctor: {apt['doctor_name']}")
+                print(f"🩺 Service: {apt['service_name']}")
+                print(f"📅 Date/Time: {apt['appointment_date']} at {apt['appointment_time']}")
+                print(f"🤖 AI Summary Preview: {apt.get('summary_preview', 'No summary')}...")
+                print("-" * 50)
+        else:
+            print("\n📅 No appointments found in the enhanced system yet.")
+    except:
+        print("\n📅 No appointments available in enhanced system yet.")
+    print()
+
+async def show_services():
+    """Print every service grouped by department"""
+    services = await db_manager.execute_listing(LIST_SERVICES_SQL)
+    # Lines are collected and written to the terminal in one call rather than one print per row
+    lines = ["\n🩺 AVAILABLE SERVICES:"]
+    current_dept = ""
+    for service in services:
+        if service['department'] != current_dept:
+            current_dept = service['department']
+            lines.append(f"\n📍 {current_dept}:")
+        lines.append(f"  • {service['name']} - ₹{service['price']} at {service['clinic_name']}")
+    lines.append("")
+    print("\n".join(lines))
+
+async def show_doctors():
+    """Print every doctor with hours and clinic"""
+    doctors = await db_manager.execute_listing(LIST_DOCTORS_SQL)
+    lines = ["\n👩‍⚕️ AVAILABLE DOCTORS:"]
+    for doctor in doctors:
+        lines.append(f"  • Dr. {doctor['name']} - {doctor['specialty']}")
+        lines.append(f"    Hours: {doctor['working_hours_display']} at {doctor['clinic_name']}")
+    lines.append("")
+    print("\n".join(lines))
+
+async def show_clinics():
+    """Print every clinic location"""
+    clinics = await db_manager.execute_listing(LIST_CLINICS_SQL)
+    lines = ["\n🏥 OUR CLINICS:"]
+    for clinic in clinics:
+        lines.append(f"  • {clinic['name']}")
+        lines.append(f"    📍 {clinic['address']}")
+        lines.append(f"    📞 {clinic['phone']} | ⏰ {clinic['operating_hours']}")
+        lines.append("")
+    print("\n".join(lines))
+
+async def prefetch_listings():
+    """Warm the listing cache for the terminal commands while the user is typing"""
+    await asyncio.gather(*(db_manager.execute_listing(query) for query in (LIST_SERVICES_SQL, LIST_DOCTORS_SQL, LIST_CLINICS_SQL)))
+
+async def read_terminal_line(prompt: str) -> str:
+    """Read one line from the terminal on a daemon thread so the event loop keeps running meanwhile"""
+    loop = asyncio.get_running_loop()
+    line = loop.create_future()
+    
+    def settle(result=None, error=None):
+        if not line.done():
+            line.set_exception(error) if error else line.set_result(result)
+    
+    def read():
+        # A daemon thread, unlike the default executor, does not hold up shutdown while blocked in input()
+        try:
+            loop.call_soon_threadsafe(settle, input(prompt))
+        except BaseException as e:
+            loop.call_soon_threadsafe(settle, None, e)
+    
+    threading.Thread(target=read, name="terminal-input", daemon=True).start()
+    return await line
+
+# Terminal display commands; quit and reset stay in the loop because they change its state
+QUIT_COMMANDS = frozenset(('quit', 'exit', 'bye'))
+TERMINAL_COMMANDS = {
+    'help': show_help,
+    'appointments': show_recent_appointments,
+    'services': show_services,
+    'doctors': show_doctors,
+    'clinics': show_clinics,
+}
+
 async def main_chat_loop():
     """Enhanced main chat loop for terminal interaction"""
     print("\n" + "="*70)
@@ -1182,110 +1819,33 @@ async def main_chat_loop():
     session_id = f"terminal_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
     # Welcome message
-    welcome_response = await ai_manager.generate_response(
+    await print_streamed_reply(
         "Hello! Please provide a warm welcome message explaining your enhanced capabilities including AI patient summaries for doctors, and ask how you can help with healthcare needs today.",
         session_id
     )
-    print(f"\n🤖 HealthBot AI: {welcome_response}\n")
     
     while True:
         try:
-            user_input = input("👤 You: ").strip()
+            # Listings are refreshed in the background while the user types the next command
+            prefetch = asyncio.create_task(prefetch_listings())
+            user_input = (await read_terminal_line("👤 You: ")).strip()
             
-            if user_input.lower() in ['quit', 'exit', 'bye']:
+            command = user_input.lower()
+            
+            if command in QUIT_COMMANDS:
                 print("\n🤖 HealthBot AI: Thank you for using our enhanced healthcare service. Take care and stay healthy! 👋")
                 break
             
-            if user_input.lower() == 'help':
-                print("\n📋 ENHANCED COMMANDS AVAILABLE:")
-                print("• 'services' - View all available healthcare services")
-                print("• 'doctors' - View all available doctors")
-                print("• 'clinics' - View all clinic locations")
-                print("• 'appointments' - View recent appointments with AI summaries")
-                print("• 'reset' - Start a new conversation")
-                print("• 'quit/exit/bye' - End conversation")
-                print("\n✨ ENHANCED FEATURES:")
-                print("• AI-generated 200-word patient summaries for doctors")
-                print("• Comprehensive appointment data storage")
-                print("• Smart symptom analysis and service recommendations")
-                print("• Complete patient interaction tracking")
-                print("• Just type naturally to book appointments or ask health questions!")
-                print()
-                continue
-            
-            if user_input.lower() == 'reset':
+            if command == 'reset':
                 session_id = f"terminal_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                ai_manager.conversation_history[session_id] = []
+                ai_manager.conversation_history.pop(session_id, None)
                 print("\n🔄 Conversation reset! Starting fresh with enhanced capabilities...\n")
                 continue
             
-            if user_input.lower() == 'appointments':
-                try:
-                    recent_appointments = db_manager.execute_dynamic_query("""
-                        SELECT appointment_number, patient_name, doctor_name, service_name,
-                               appointment_date, appointment_time, status, created_at,
-                               SUBSTR(ai_patient_summary, 1, 100) as summary_preview
-                        FROM enhanced_appointments 
-                        ORDER BY created_at DESC 
-                        LIMIT 5
-                    """, (), "appointments")
-                    
-                    if recent_appointments:
-                        print("\n📅 RECENT APPOINTMENTS WITH AI SUMMARIES:")
-                        for apt in recent_appointments:
-                            print(f"\n🆔 {apt['appointment_number']} - {apt['status'].upper()}")
-                            print(f"👤 Patient: {apt['patient_name']}")
-                            print(f"👩‍⚕️ Doctor: {apt['doctor_name']}")
-                            print(f"🩺 Service: {apt['service_name']}")
-                            print(f"📅 Date/Time: {apt['appointment_date']} at {apt['appointment_time']}")
-                            print(f"🤖 AI Summary Preview: {apt.get('summary_preview', 'No summary')}...")
-                            print("-" * 50)
-                    else:
-                        print("\n📅 No appointments found in the enhanced system yet.")
-                except:
-                    print("\n📅 No appointments available in enhanced system yet.")
-                print()
-                continue
-            
-            if user_input.lower() == 'services':
-                services = db_manager.execute_dynamic_query("""
-                    SELECT s.name, s.department, s.price, c.name as clinic_name
-                    FROM services s JOIN clinics c ON s.clinic_id = c.id
-                    ORDER BY s.department, s.name
-                """)
-                print("\n🩺 AVAILABLE SERVICES:")
-                current_dept = ""
-                for service in services:
-                    if service['department'] != current_dept:
-                        current_dept = service['department']
-                        print(f"\n📍 {current_dept}:")
-                    print(f"  • {service['name']} - ₹{service['price']} at {service['clinic_name']}")
-                print()
-                continue
-            
-            if user_input.lower() == 'doctors':
-                doctors = db_manager.execute_dynamic_query("""
-                    SELECT d.name, d.specialty, d.working_hours_display, c.name as clinic_name
-                    FROM doctors d JOIN clinics c ON d.clinic_id = c.id
-                    ORDER BY d.specialty, d.name
-                """)
-                print("\n👩‍⚕️ AVAILABLE DOCTORS:")
-                for doctor in doctors:
-                    print(f"  • Dr. {doctor['name']} - {doctor['specialty']}")
-                    print(f"    Hours: {doctor['working_hours_display']} at {doctor['clinic_name']}")
-                print()
-                continue
-            
-            if user_input.lower() == 'clinics':
-                clinics = db_manager.execute_dynamic_query("""
-                    SELECT name, address, phone, operating_hours FROM clinics ORDER BY name
-                """)
-                print("\n🏥 OUR CLINICS:")
-                for clinic in clinics:
-                    print(f"  • {clinic['name']}")
-                    print(f"    📍 {clinic['address']}")
-                    print(f"    📞 {clinic['phone']} | ⏰ {clinic['operating_hours']}")
-                    print()
+            # Display commands are looked up once instead of compared one by one
+            handler = TERMINAL_COMMANDS.get(command)
+            if handler:
+                await handler()
                 continue
             
             if not user_input:
@@ -1293,10 +1853,10 @@ async def main_chat_loop():
             
             # Process with enhanced AI
             print("\n🤔 Processing your request with enhanced AI capabilities...")
-            response = await ai_manager.generate_response(user_input, session_id)
-            print(f"\n🤖 HealthBot AI: {response}\n")
+            await print_streamed_reply(user_input, session_id)
             
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            # Ctrl+C arrives as a cancellation while the loop awaits input
             print("\n\n👋 Goodbye! Stay healthy!")
             break
         except Exception as e:
@@ -1304,63 +1864,77 @@ async def main_chat_loop():
             print(f"\n❌ Sorry, I encountered an error: {str(e)}")
             print("Please try again or contact our clinic directly.\n")
 
+async def ensure_api_key() -> bool:
+    """Prompt for the Gemini API key if none is configured; returns whether one is set"""
+    global GEMINI_API_KEY
+    if GEMINI_API_KEY and GEMINI_API_KEY != "your-gemini-api-key-here":
+        return True
+    
+    print("\n⚠️  WARNING: Please set your GEMINI_API_KEY!")
+    print("🔧 Option 1: Set environment variable - export GEMINI_API_KEY='your-actual-key'")
+    print("🔧 Option 2: Edit the GEMINI_API_KEY variable in this file")
+    print("🔗 Get your API key from: https://makersuite.google.com/app/apikey")
+    
+    # Ask user if they want to input API key now
+    api_key_input = (await read_terminal_line("\n💡 Enter your Gemini API key now (or press Enter to exit): ")).strip()
+    if not api_key_input:
+        print("❌ Cannot proceed without API key. Exiting...")
+        return False
+    genai.configure(api_key=api_key_input)
+    GEMINI_API_KEY = api_key_input
+    print("✅ API key configured!")
+    return True
+
+async def check_gemini() -> bool:
+    """Make sure an API key is set, then ping Gemini with it"""
+    if not await ensure_api_key():
+        return False
+    await ai_manager.generate_content_async("Hello! Just testing the enhanced connection with patient summary capabilities.")
+    return True
+
+async def start_terminal_chat() -> bool:
+    """Run the database and Gemini startup checks together, then start the chat loop; False if no API key was given"""
+    # Test database connections while the API key is entered and Gemini answers, and warm the
+    # listing cache meanwhile; all three counts come back from one statement
+    test_counts, gemini_ready, _ = await asyncio.gather(
+        db_manager.execute_async("""
+            SELECT (SELECT COUNT(*) FROM services) as services,
+                   (SELECT COUNT(*) FROM doctors) as doctors,
+                   (SELECT COUNT(*) FROM clinics) as clinics
+        """),
+        check_gemini(),
+        prefetch_listings()
+    )
+    if not gemini_ready:
+        return False
+    test_counts = test_counts[0]
+    
+    print("\n🏥 Enhanced Database Status:")
+    print(f"   ✅ Services: {test_counts['services']} available")
+    print(f"   ✅ Doctors: {test_counts['doctors']} available") 
+    print(f"   ✅ Clinics: {test_counts['clinics']} locations")
+    print(f"   ✅ Enhanced appointments table ready")
+    print(f"   ✅ AI patient summaries enabled")
+    print("   ✅ Enhanced Gemini AI: Connected and responsive")
+    
+    print("\n🚀 All enhanced systems ready! Starting chat interface...")
+    print("✨ Features: AI Patient Summaries | Comprehensive Data Storage | Smart Analytics")
+    print("="*70)
+    
+    # Start the enhanced interactive chat interface
+    await main_chat_loop()
+    return True
+
 # ------------------------------------------------------------------------------
 # Server Startup
 # ------------------------------------------------------------------------------
 if __name__ == "__main__":
     logger.info("🚀 Starting Enhanced Healthcare Gemini AI MCP Server...")
     
-    # Check if Gemini API key is configured
-    if GEMINI_API_KEY == "your-gemini-api-key-here" or not GEMINI_API_KEY:
-        print("\n⚠️  WARNING: Please set your GEMINI_API_KEY!")
-        print("🔧 Option 1: Set environment variable - export GEMINI_API_KEY='your-actual-key'")
-        print("🔧 Option 2: Edit the GEMINI_API_KEY variable in this file")
-        print("🔗 Get your API key from: https://makersuite.google.com/app/apikey")
-        
-        # Ask user if they want to input API key now
-        api_key_input = input("\n💡 Enter your Gemini API key now (or press Enter to exit): ").strip()
-        if api_key_input:
-            genai.configure(api_key=api_key_input)
-            GEMINI_API_KEY = api_key_input
-            print("✅ API key configured!")
-        else:
-            print("❌ Cannot proceed without API key. Exiting...")
-            sys.exit(1)
-    
-    # Verify database files exist
-    if not os.path.exists(SERVICES_DB_PATH):
-        print(f"\n❌ Database file not found: {SERVICES_DB_PATH}")
-        print("🔧 Please run: python healthcare_db_setup.py")
-        sys.exit(1)
-    
-    if not os.path.exists(APPOINTMENTS_DB_PATH):
-        print(f"\n❌ Database file not found: {APPOINTMENTS_DB_PATH}")
-        print("🔧 Please run: python healthcare_db_setup.py")
-        sys.exit(1)
-    
     try:
-        # Test database connections
-        test_services = db_manager.execute_dynamic_query("SELECT COUNT(*) as count FROM services")
-        test_doctors = db_manager.execute_dynamic_query("SELECT COUNT(*) as count FROM doctors")
-        test_clinics = db_manager.execute_dynamic_query("SELECT COUNT(*) as count FROM clinics")
-        
-        print("\n🏥 Enhanced Database Status:")
-        print(f"   ✅ Services: {test_services[0]['count']} available")
-        print(f"   ✅ Doctors: {test_doctors[0]['count']} available") 
-        print(f"   ✅ Clinics: {test_clinics[0]['count']} locations")
-        print(f"   ✅ Enhanced appointments table ready")
-        print(f"   ✅ AI patient summaries enabled")
-        
-        # Test Gemini AI connection
-        test_response = ai_manager.model.generate_content("Hello! Just testing the enhanced connection with patient summary capabilities.")
-        print("   ✅ Enhanced Gemini AI: Connected and responsive")
-        
-        print("\n🚀 All enhanced systems ready! Starting chat interface...")
-        print("✨ Features: AI Patient Summaries | Comprehensive Data Storage | Smart Analytics")
-        print("="*70)
-        
-        # Start the enhanced interactive chat interface
-        asyncio.run(main_chat_loop())
+        # Startup checks, the API key prompt and the interactive chat interface share one event loop
+        if not asyncio.run(start_terminal_chat()):
+            sys.exit(1)
         
     except Exception as e:
         logger.exception(f"Enhanced server startup failed: {e}")
@@ -1376,8 +1950,7 @@ if __name__ == "__main__":
         # Clean shutdown
         try:
             if 'db_manager' in globals():
-                db_manager.services_conn.close()
-                db_manager.appointments_conn.close()
+                db_manager.close()
                 logger.info("Enhanced database connections closed successfully.")
         except Exception as e:
             logger.warning(f"Error closing enhanced database connections: {e}")